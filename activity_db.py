@@ -0,0 +1,262 @@
+import hashlib
+import json
+import sqlite3
+from datetime import date, timedelta
+
+# --- CONFIGURATION ---
+
+# Path to the local activity database
+DB_FILE = "activities.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY,
+    athlete_id INTEGER NOT NULL,
+    type TEXT,
+    name TEXT,
+    start_date TEXT NOT NULL,
+    start_date_local TEXT NOT NULL,
+    distance REAL NOT NULL,
+    moving_time INTEGER NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_athlete_type_date
+    ON activities (athlete_id, type, start_date_local);
+CREATE INDEX IF NOT EXISTS idx_activities_athlete_start
+    ON activities (athlete_id, start_date);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    athlete_id INTEGER PRIMARY KEY,
+    latest_start_date TEXT,
+    synced_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS access_tokens (
+    token_hash TEXT PRIMARY KEY,
+    athlete_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS run_rollups (
+    athlete_id INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    run_count INTEGER NOT NULL,
+    distance REAL NOT NULL,
+    moving_time INTEGER NOT NULL,
+    longest_distance REAL NOT NULL,
+    PRIMARY KEY (athlete_id, period, period_start)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    athlete_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS speed_curves (
+    athlete_id INTEGER PRIMARY KEY,
+    curve BLOB NOT NULL,
+    activity_ids TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS zone_histograms (
+    activity_id INTEGER PRIMARY KEY,
+    athlete_id INTEGER NOT NULL,
+    heartrate BLOB NOT NULL,
+    pace BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_zone_histograms_athlete
+    ON zone_histograms (athlete_id);
+"""
+
+# Rollup periods and the SQL for the bucket start of a local start date
+# (weeks start on Monday, matching period_bounds)
+ROLLUP_PERIODS = {
+    "week": "date(substr(start_date_local, 1, 10), 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', substr(start_date_local, 1, 10))",
+}
+
+# Bump when the rollup columns or buckets change so every athlete's rollups
+# are rebuilt once on their next read
+ROLLUPS_VERSION = 1
+
+# --- CONNECTION ---
+
+def connect(path=DB_FILE):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# --- ATHLETES AND SYNC STATE ---
+
+def hash_token(access_token):
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+def get_athlete_id(conn, access_token):
+    row = conn.execute("SELECT athlete_id FROM access_tokens WHERE token_hash = ?",
+                       (hash_token(access_token),)).fetchone()
+    return row[0] if row else None
+
+def save_athlete_id(conn, access_token, athlete_id):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO access_tokens (token_hash, athlete_id) VALUES (?, ?)",
+                     (hash_token(access_token), athlete_id))
+
+def get_sync_state(conn, athlete_id):
+    row = conn.execute("SELECT latest_start_date, synced_at FROM sync_state WHERE athlete_id = ?",
+                       (athlete_id,)).fetchone()
+    if row is None:
+        return None
+    return {"latest_start_date": row[0], "synced_at": row[1]}
+
+def save_sync_state(conn, athlete_id, synced_at):
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO sync_state (athlete_id, latest_start_date, synced_at)
+            VALUES (?, (SELECT MAX(start_date) FROM activities WHERE athlete_id = ?), ?)
+        """, (athlete_id, athlete_id, synced_at))
+
+# --- ACTIVITIES ---
+
+def upsert_activities(conn, activities):
+    rows = [(
+        act["id"],
+        act["athlete"]["id"],
+        act.get("type"),
+        act.get("name"),
+        act["start_date"],
+        act["start_date_local"],
+        act.get("distance") or 0,
+        act.get("moving_time") or 0,
+        json.dumps(act)
+    ) for act in activities]
+    with conn:
+        # Rollup buckets touched by these activities, including the old date
+        # of activities that already exist, are refreshed in the same transaction
+        touched = {(row[1], row[5][:10]) for row in rows}
+        for i in range(0, len(rows), 500):
+            ids = [row[0] for row in rows[i:i + 500]]
+            touched.update(conn.execute(f"""
+                SELECT athlete_id, substr(start_date_local, 1, 10) FROM activities
+                WHERE id IN ({",".join("?" * len(ids))})
+            """, ids).fetchall())
+        conn.executemany("""
+            INSERT OR REPLACE INTO activities
+                (id, athlete_id, type, name, start_date, start_date_local, distance, moving_time, raw)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        refresh_rollups(conn, touched)
+    return len(rows)
+
+# --- ROLLUPS ---
+
+def period_bounds(period, day):
+    day = date.fromisoformat(day)
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start.isoformat(), (start + timedelta(days=7)).isoformat()
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.isoformat(), end.isoformat()
+
+def refresh_rollups(conn, athlete_days):
+    # Recompute only the touched buckets from the indexed activities, so
+    # rollups stay exact even when an existing activity is edited or moved
+    buckets = {(athlete_id, period, period_bounds(period, day))
+               for athlete_id, day in athlete_days for period in ROLLUP_PERIODS}
+    for athlete_id, period, (start, end) in buckets:
+        conn.execute("DELETE FROM run_rollups WHERE athlete_id = ? AND period = ? AND period_start = ?",
+                     (athlete_id, period, start))
+        conn.execute("""
+            INSERT INTO run_rollups
+            SELECT athlete_id, ?, ?, COUNT(*), SUM(distance), SUM(moving_time), MAX(distance)
+            FROM activities
+            WHERE athlete_id = ? AND type = 'Run' AND start_date_local >= ? AND start_date_local < ?
+            GROUP BY athlete_id
+        """, (period, start, athlete_id, start, end))
+
+def rebuild_rollups(conn, athlete_id):
+    with conn:
+        conn.execute("DELETE FROM run_rollups WHERE athlete_id = ?", (athlete_id,))
+        conn.execute("INSERT OR REPLACE INTO rollup_state (athlete_id, version) VALUES (?, ?)",
+                     (athlete_id, ROLLUPS_VERSION))
+        for period, bucket_sql in ROLLUP_PERIODS.items():
+            conn.execute(f"""
+                INSERT INTO run_rollups
+                SELECT athlete_id, ?, {bucket_sql} AS period_start,
+                       COUNT(*), SUM(distance), SUM(moving_time), MAX(distance)
+                FROM activities
+                WHERE athlete_id = ? AND type = 'Run'
+                GROUP BY athlete_id, period_start
+            """, (period, athlete_id))
+
+def get_rollups(conn, athlete_id, period, since, until):
+    # Each athlete's rollups are rebuilt once from all their activities, which
+    # backfills databases from before rollups existed. Incremental refreshes
+    # may already have written a few buckets, so the backfill is tracked in
+    # rollup_state rather than inferred from run_rollups being empty.
+    row = conn.execute("SELECT version FROM rollup_state WHERE athlete_id = ?", (athlete_id,)).fetchone()
+    if row is None or row[0] != ROLLUPS_VERSION:
+        rebuild_rollups(conn, athlete_id)
+    return conn.execute("""
+        SELECT period_start, run_count, distance, moving_time, longest_distance
+        FROM run_rollups
+        WHERE athlete_id = ? AND period = ? AND period_start >= ? AND period_start <= ?
+        ORDER BY period_start
+    """, (athlete_id, period, since, until)).fetchall()
+
+# --- SPEED CURVES ---
+
+def get_speed_curve(conn, athlete_id):
+    # The athlete's mean-maximal speed curve and the activities merged into it
+    row = conn.execute("SELECT curve, activity_ids FROM speed_curves WHERE athlete_id = ?", (athlete_id,)).fetchone()
+    if row is None:
+        return None, set()
+    return row[0], set(json.loads(row[1]))
+
+def save_speed_curve(conn, athlete_id, curve, activity_ids):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO speed_curves (athlete_id, curve, activity_ids) VALUES (?, ?, ?)",
+                     (athlete_id, curve, json.dumps(sorted(activity_ids))))
+
+# --- ZONE HISTOGRAMS ---
+
+def get_histogram_activity_ids(conn, athlete_id):
+    rows = conn.execute("SELECT activity_id FROM zone_histograms WHERE athlete_id = ?", (athlete_id,)).fetchall()
+    return {row[0] for row in rows}
+
+def save_zone_histograms(conn, athlete_id, histograms):
+    # histograms: (activity_id, heartrate bytes, pace bytes) per activity
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO zone_histograms (activity_id, athlete_id, heartrate, pace) VALUES (?, ?, ?, ?)
+        """, [(activity_id, athlete_id, heartrate, pace) for activity_id, heartrate, pace in histograms])
+
+def load_zone_histograms(conn, athlete_id):
+    # With each activity's local start date, oldest first
+    return conn.execute("""
+        SELECT a.start_date_local, h.heartrate, h.pace
+        FROM zone_histograms h JOIN activities a ON a.id = h.activity_id
+        WHERE h.athlete_id = ?
+        ORDER BY a.start_date_local
+    """, (athlete_id,)).fetchall()
+
+# --- QUERIES ---
+
+def get_data_version(conn, athlete_id):
+    # Changes whenever a sync stores new activities for the athlete
+    count, latest = conn.execute("SELECT COUNT(*), MAX(start_date) FROM activities WHERE athlete_id = ?",
+                                 (athlete_id,)).fetchone()
+    return f"{count}:{latest}"
+
+def load_activities(conn, athlete_id):
+    rows = conn.execute("SELECT raw FROM activities WHERE athlete_id = ? ORDER BY start_date",
+                        (athlete_id,)).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+def run_activity_ids(conn, athlete_id):
+    # Newest first, so stream backfills start with the runs shown first
+    rows = conn.execute("SELECT id FROM activities WHERE athlete_id = ? AND type = 'Run' ORDER BY start_date DESC",
+                        (athlete_id,)).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,60 @@
+import numpy as np
+
+# --- CONFIGURATION ---
+
+# Distance buckets in KM; each bucket includes its upper edge
+DISTANCE_BUCKETS_KM = [0, 5, 10, 15, 21.0975, 42.195, np.inf]
+DISTANCE_BUCKET_LABELS = ["0-5 km", "5-10 km", "10-15 km", "15 km-Half", "Half-Marathon", "Marathon+"]
+
+# --- WEIGHTED PACE ---
+
+def weighted_pace(moving_time_sec, distance_km):
+    # Total time over total distance, so a 3 km jog does not count as much as
+    # a 30 km long run; NaN where there is no distance to divide by
+    moving_time_sec = np.asarray(moving_time_sec, dtype=np.float64)
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    return np.divide(moving_time_sec, distance_km, out=np.full(distance_km.shape, np.nan), where=distance_km > 0)
+
+# --- GROUPINGS ---
+
+def group_key(runs_df, by):
+    import pandas as pd
+
+    if by == "week":
+        dates = runs_df["date"]
+        return (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.normalize().rename("week_start")
+    if by == "month":
+        return runs_df["date"].dt.to_period("M").dt.start_time.rename("month_start")
+    if by == "distance_bucket":
+        return pd.cut(runs_df["distance_km"], DISTANCE_BUCKETS_KM, labels=DISTANCE_BUCKET_LABELS,
+                      include_lowest=True).rename("distance_bucket")
+    # Any other column of the runs table, e.g. "sport_type"
+    return runs_df[by]
+
+def aggregate_runs(runs_df, by=None):
+    # One vectorized pass over the prepared runs table. by is None for totals
+    # over every row, or one (or a list) of "week", "month", "distance_bucket"
+    # or a column name; the result is indexed by the groups.
+    import pandas as pd
+
+    totals = pd.DataFrame({
+        "distance_km": runs_df["distance_km"].astype(np.float64),
+        "moving_time_sec": runs_df["moving_time_min"].astype(np.float64) * 60
+    })
+    if by is None:
+        keys = np.zeros(len(runs_df), dtype=np.int8)
+    else:
+        keys = [group_key(runs_df, key) for key in ([by] if isinstance(by, str) else by)]
+
+    grouped = totals.groupby(keys, observed=True, sort=True).agg(
+        run_count=("distance_km", "size"),
+        distance_km=("distance_km", "sum"),
+        moving_time_sec=("moving_time_sec", "sum"),
+        longest_km=("distance_km", "max")
+    )
+    grouped["pace_sec_per_km"] = weighted_pace(grouped["moving_time_sec"], grouped["distance_km"])
+    return grouped
+
+def overall_pace(runs_df):
+    totals = aggregate_runs(runs_df)
+    return totals["pace_sec_per_km"].iloc[0] if len(totals) else np.nan
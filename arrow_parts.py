@@ -0,0 +1,87 @@
+import glob
+import os
+import uuid
+
+# Append-only Arrow IPC datasets, one directory of part files each, shared by
+# runs_cache and streams_store. Writers add a part instead of rewriting the
+# dataset, and merge the parts into one past MAX_PARTS. Readers memory-map
+# the parts, so nothing is parsed or copied. pyarrow is imported where it is
+# used, like pandas in the dashboard, so importing the stores stays cheap.
+
+# --- CONFIGURATION ---
+
+# Appends are written as separate part files and compacted past this count
+MAX_PARTS = 16
+
+# Times a reader lists the parts again when a compaction removed one under it
+READ_ATTEMPTS = 3
+
+# --- PARTS ---
+
+def list_parts(directory):
+    # Oldest first; later parts win where datasets dedupe
+    return sorted(glob.glob(os.path.join(directory, "part-*.arrow")))
+
+def next_part_path(directory, parts):
+    # The random suffix keeps concurrent appends from replacing each other
+    number = int(os.path.basename(parts[-1]).split("-")[1]) + 1 if parts else 0
+    return os.path.join(directory, f"part-{number:06d}-{uuid.uuid4().hex[:8]}.arrow")
+
+def write_part(path, schema, batches):
+    # Written to a temp file and renamed, so readers never see a partial part
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with ipc.new_file(sink, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+def open_part(path):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    return ipc.open_file(pa.memory_map(path, "r"))
+
+# --- DATASETS ---
+
+def read_parts(directory, read):
+    # Returns read(parts) for the current parts, listing them again if a
+    # compaction removed one between listing and opening it
+    for _ in range(READ_ATTEMPTS):
+        try:
+            return read(list_parts(directory))
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(f"Parts in {directory} kept changing while being read")
+
+def append_part(directory, schema, batches, merge, max_parts=MAX_PARTS):
+    # merge(parts) returns the (schema, batches) replacing the given parts
+    os.makedirs(directory, exist_ok=True)
+    parts = list_parts(directory)
+    write_part(next_part_path(directory, parts), schema, batches)
+    if len(parts) + 1 > max_parts:
+        compact_parts(directory, merge)
+
+def compact_parts(directory, merge):
+    # Writes the merged parts as one new part, then drops the parts it
+    # replaces; parts appended meanwhile are kept. If a concurrent compaction
+    # already removed some of them, that one does the work instead.
+    parts = list_parts(directory)
+    try:
+        schema, batches = merge(parts)
+        write_part(next_part_path(directory, parts), schema, batches)
+    except FileNotFoundError:
+        return
+    for path in parts:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
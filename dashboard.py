@@ -1,14 +1,31 @@
-import requests
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import json
+import numpy as np
+import requests
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import activity_db
+import aggregation
+import downsample
+import goal_store
+import runs_cache
+import stream_metrics
+import strava_api
+import streams_store
+
 # --- CONFIGURATION ---
 
-# Path to save and load your goal settings
-GOAL_FILE = "goal.json"
+# How often to pull new activities from Strava into the local database
+SYNC_INTERVAL_SEC = 300  # reruns within this window reuse the stored activities
+
+# Strava API
+STRAVA_ATHLETE_URL = "https://www.strava.com/api/v3/athlete"
+STRAVA_ACTIVITIES_URL = "https://www.strava.com/api/v3/athlete/activities"
+ACTIVITIES_PER_PAGE = 200  # Strava's maximum page size
+MAX_CONCURRENT_PAGES = 4  # bounded fan-out to stay inside Strava's rate limit
 
 # Default race distances in KM
 RACE_DISTANCES = {
@@ -18,41 +35,208 @@ RACE_DISTANCES = {
     "Marathon": 42.195
 }
 
+# Runs longer than this count towards training load (KM)
+LONG_RUN_KM = 10
+
+# Training load and the analyst look at runs from this many recent weeks
+RECENT_WEEKS = 8
+
+# Weeks shown in the pace trend, before the current week
+PACE_TREND_WEEKS = 12
+
+# Months shown in the monthly summary, including the current month
+MONTHLY_SUMMARY_MONTHS = 12
+
+# Split lengths offered for a run's split table, in metres
+SPLIT_UNITS = {"km": 1000, "mi": 1609.344}
+
+# Heart-rate zones by upper bound as a fraction of max heart rate; with
+# MAX_HEARTRATE = None it is estimated from the streams
+MAX_HEARTRATE = None
+HR_ZONES = {"Z1 Recovery": 0.6, "Z2 Endurance": 0.7, "Z3 Tempo": 0.8, "Z4 Threshold": 0.9, "Z5 VO2max": np.inf}
+
+# Pace zones by upper bound relative to the goal's target pace (slower is larger)
+PACE_ZONES = {"Faster than goal": 0.97, "Goal pace": 1.03, "Steady": 1.15, "Easy": np.inf}
+
+# Recent weeks the analyst looks at for effort
+EFFORT_WEEKS = 4
+
+# Chart backend: "vega-lite" sends the weekly series to the browser, which
+# draws it and handles zoom / pan; "matplotlib" renders images on the server
+CHART_BACKEND = "vega-lite"
+
+# Server-rendered charts: "png" or "svg", and how many renders each chart keeps
+CHART_FORMAT = "png"
+CHART_CACHE_ENTRIES = 32
+
+# Most points any chart series draws, whatever the length of the history
+CHART_MAX_POINTS = downsample.MAX_CHART_POINTS
+
 # --- HELPER FUNCTIONS ---
 
-def save_goal(goal_data):
-    with open(GOAL_FILE, "w") as f:
-        json.dump(goal_data, f)
+def start_date_to_epoch(start_date):
+    return int(datetime.fromisoformat(start_date.replace("Z", "+00:00")).timestamp())
 
-def load_goal():
-    try:
-        with open(GOAL_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return None
+class StravaUnavailable(Exception):
+    # Strava could not be reached, throttled us, or refused the request
+    pass
 
-def fetch_activities(access_token):
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    params = {"per_page": 50}
-    response = requests.get(url, headers=headers, params=params)
+def sync_activities(conn, access_token):
+    # Returns the athlete and why the sync failed, if it did. Once activities
+    # are stored, a failed sync keeps serving them rather than blanking the
+    # dashboard; only a first sync with nothing stored raises StravaUnavailable.
+    athlete_id = activity_db.get_athlete_id(conn, access_token)
+    if athlete_id is None:
+        athlete_id = fetch_athlete(access_token)["id"]
+        activity_db.save_athlete_id(conn, access_token, athlete_id)
+
+    sync_state = activity_db.get_sync_state(conn, athlete_id)
+    now = time.time()
+    if sync_state is not None and now - sync_state["synced_at"] < SYNC_INTERVAL_SEC:
+        return athlete_id, None
+
+    try:
+        if sync_state is None or sync_state["latest_start_date"] is None:
+            activities = fetch_activities(access_token)
+        else:
+            after = start_date_to_epoch(sync_state["latest_start_date"])
+            activities = fetch_activities(access_token, after=after)
+    except StravaUnavailable as e:
+        if sync_state is None:
+            raise
+        return athlete_id, str(e)
+
+    # Append to the runs cache before recording the sync, so a failed write
+    # is retried by the next sync rather than silently missing from the cache
+    if runs_cache.has_runs(athlete_id):
+        runs_cache.append_runs(athlete_id, prepare_runs(activities))
+    activity_db.upsert_activities(conn, activities)
+    activity_db.save_sync_state(conn, athlete_id, now)
+
+    # Per-second streams of new runs are fetched in the background
+    streams_store.request_backfill(athlete_id, access_token)
+    return athlete_id, None
+
+def load_runs(conn, athlete_id):
+    df = runs_cache.load_runs(athlete_id)
+    if df is None:
+        # Cold cache: prepare every stored run once, later syncs only append
+        runs_cache.append_runs(athlete_id, prepare_runs(activity_db.load_activities(conn, athlete_id)))
+        df = runs_cache.load_runs(athlete_id)
+    return df
+
+def check_response(response, what):
     if response.status_code != 200:
-        st.error(f"Failed to fetch activities from Strava (status code {response.status_code})")
-        st.stop()
+        raise StravaUnavailable(f"Failed to fetch {what} from Strava (status code {response.status_code})")
     return response.json()
 
+def strava_get(url, headers=None, params=None):
+    try:
+        return strava_api.get(url, headers=headers, params=params)
+    except strava_api.RateLimitExceeded as e:
+        raise StravaUnavailable(str(e)) from e
+    except requests.RequestException as e:
+        raise StravaUnavailable(f"Couldn't reach Strava: {e}") from e
+
+def fetch_athlete(access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = strava_get(STRAVA_ATHLETE_URL, headers=headers)
+    return check_response(response, "athlete")
+
+def fetch_activities(access_token, after=None):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    # Walk every page over the shared connection pool: the first page alone
+    # (an incremental sync rarely needs more), then a batch of pages at a time.
+    # Every page goes through the shared rate-limit scheduler.
+    activities = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PAGES) as pool:
+        def get_page(page):
+            params = {"per_page": ACTIVITIES_PER_PAGE, "page": page}
+            if after is not None:
+                params["after"] = after
+            return strava_get(STRAVA_ACTIVITIES_URL, headers=headers, params=params)
+
+        pages = range(1, 2)
+        while True:
+            responses = list(pool.map(get_page, pages))
+            for response in responses:
+                page_activities = check_response(response, "activities")
+                activities.extend(page_activities)
+                if len(page_activities) < ACTIVITIES_PER_PAGE:
+                    return activities
+            pages = range(pages.stop, pages.stop + MAX_CONCURRENT_PAGES)
+
+def with_input_shape(result, like):
+    # Scalars in, scalar out; Series in, Series out (same index); else arrays.
+    # A Series can only exist once pandas is loaded, so don't import it here
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(like, pd.Series):
+        return pd.Series(result, index=like.index)
+    if np.ndim(like) == 0:
+        return result[()]
+    return result
+
 def calculate_pace(moving_time, distance_meters):
-    if distance_meters == 0:
-        return 0
-    pace_sec = moving_time / (distance_meters / 1000)
-    return pace_sec
-
-def seconds_to_pace(sec_per_km):
-    if sec_per_km == 0 or sec_per_km == float('inf'):
-        return "-"
-    minutes = int(sec_per_km // 60)
-    seconds = int(sec_per_km % 60)
-    return f"{minutes}:{seconds:02d} min/km"
+    # Zero distance gives a pace of 0 rather than inf, as the dashboard expects
+    distance_km = np.asarray(distance_meters, dtype=np.float64) / 1000
+    moving_time_arr = np.asarray(moving_time, dtype=np.float64)
+    shape = np.broadcast_shapes(moving_time_arr.shape, distance_km.shape)
+    pace_sec = np.divide(moving_time_arr, distance_km, out=np.zeros(shape), where=distance_km != 0)
+    like = distance_meters if np.ndim(distance_meters) else moving_time
+    return with_input_shape(pace_sec, like)
+
+def seconds_to_pace(sec_per_km, unit="km"):
+    # unit only labels the result, e.g. "mi" for seconds per mile
+    values = np.asarray(sec_per_km, dtype=np.float64)
+    valid = np.isfinite(values) & (values != 0)
+    total = np.floor(np.where(valid, values, 0)).astype(np.int64)
+    # Paces repeat heavily at whole-second resolution, so only format unique values
+    unique, inverse = np.unique(total, return_inverse=True)
+    labels = np.array([f"{t // 60}:{t % 60:02d} min/{unit}" for t in unique.tolist()], dtype=object)
+    formatted = np.where(valid, labels[inverse.reshape(values.shape)], "-")
+    if np.ndim(sec_per_km) == 0:
+        return str(formatted[()])
+    return with_input_shape(formatted, sec_per_km)
+
+def seconds_to_duration(seconds):
+    total = int(round(seconds))
+    return f"{total // 3600}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+def iso_week_year(dates):
+    # ISO weeks belong to the year of their Thursday
+    days = dates.astype("datetime64[D]")
+    thursday = days - (days.astype(np.int64) + 3) % 7 + 3
+    year = thursday.astype("datetime64[Y]")
+    week = (thursday - year.astype("datetime64[D]")).astype(np.int32) // 7 + 1
+    return week, year.astype(np.int32) + 1970
+
+def prepare_runs(activities):
+    # One pass per column straight into typed arrays; building per-row dicts
+    # or tuples is several times slower on large histories. None when there
+    # are no runs, so a sync with nothing new never loads pandas.
+    runs = [act for act in activities if act.get("type") == "Run"]
+    n = len(runs)
+    if not n:
+        return None
+    import pandas as pd
+
+    distance_km = np.fromiter((act["distance"] for act in runs), dtype=np.float32, count=n) / 1000
+    moving_time = np.fromiter((act["moving_time"] for act in runs), dtype=np.int32, count=n)
+    dates = np.array([act["start_date_local"][:10] for act in runs], dtype="datetime64[D]")
+    week, year = iso_week_year(dates)
+    pace_sec_per_km = calculate_pace(moving_time, distance_km * 1000).astype(np.float32)
+
+    return pd.DataFrame({
+        "id": np.fromiter((act["id"] for act in runs), dtype=np.int64, count=n),
+        "name": [act["name"] for act in runs],
+        "sport_type": [act.get("sport_type") or act["type"] for act in runs],
+        "date": dates.astype("datetime64[s]"),
+        "distance_km": distance_km,
+        "moving_time_min": moving_time.astype(np.float32) / 60,
+        "pace_sec_per_km": pace_sec_per_km,
+        "week": week,
+        "year": year
+    })
 
 def generate_training_plan(today, race_day, runs_per_week):
     weeks_left = (race_day - today).days // 7
@@ -73,27 +257,376 @@ def generate_training_plan(today, race_day, runs_per_week):
         plan.append(week_plan)
     return plan
 
-def ai_analyst_response(question, goal_data, recent_runs_df):
+def ai_analyst_response(question, goal_data, recent_runs_df, effort=None):
+    # effort: share of recent heart-rate zone time that was easy (Z1-Z2) and
+    # hard (Z4-Z5), or None before any heart-rate streams are stored
+    if ("pace" in question.lower() or "ready" in question.lower() or "close" in question.lower()) \
+            and recent_runs_df.empty:
+        return f"I don't see any runs in the last {RECENT_WEEKS} weeks. Log a few runs and ask me again."
     if "pace" in question.lower():
-        avg_pace = recent_runs_df["pace_sec_per_km"].mean()
+        avg_pace = aggregation.overall_pace(recent_runs_df)
         avg_pace_formatted = seconds_to_pace(avg_pace)
         return f"Your average recent pace is {avg_pace_formatted}. Target pace for your goal is {goal_data['target_pace_formatted']}."
     if "ready" in question.lower() or "close" in question.lower():
-        avg_pace = recent_runs_df["pace_sec_per_km"].mean()
+        if goal_data["target_pace_sec"] is None:
+            return "Your goal time is invalid, so I can't compare your pace to it. Enter it as hh:mm:ss in the sidebar."
+        avg_pace = aggregation.overall_pace(recent_runs_df)
         if avg_pace < goal_data["target_pace_sec"]:
-            return "✅ You're currently pacing faster than your goal! Maintain consistency."
+            answer = "✅ You're currently pacing faster than your goal! Maintain consistency."
         else:
-            return "⚡ You're slightly behind goal pace. Focus on tempo runs and sharpening your endurance."
+            answer = "⚡ You're slightly behind goal pace. Focus on tempo runs and sharpening your endurance."
+        if effort is not None and effort["hard_share"] > 0.3:
+            answer += " Your recent runs have been mostly hard, so make sure you are recovering between them."
+        return answer
     if "next run" in question.lower():
+        if effort is not None and effort["hard_share"] > 0.2:
+            return "Recommended next run: 6–8 km easy run, keeping your heart rate in zones 1–2 after a hard block."
         return "Recommended next run: 6–8 km easy run, or a moderate tempo run based on your energy levels."
-    return "I'm a data-driven analyst. Please ask about pace, readiness, or training advice."
+    if effort is not None and any(word in question.lower() for word in ("effort", "intensity", "zone", "heart", "easy", "hard")):
+        answer = (f"Over the last {EFFORT_WEEKS} weeks, {effort['easy_share']:.0%} of your running was easy "
+                  f"(zones 1–2) and {effort['hard_share']:.0%} hard (zones 4–5).")
+        if effort["easy_share"] < 0.75:
+            return answer + " Aim for about 80% easy running: slow your easy days down to build endurance."
+        return answer + " That's a healthy balance; keep the hard sessions focused."
+    return "I'm a data-driven analyst. Please ask about pace, effort, readiness, or training advice."
+
+# --- PIPELINE STAGES ---
+# Streamlit reruns this script on every widget change, so each stage is cached
+# on the inputs it really depends on. data_version changes only when a sync
+# stores new activities, so goal edits reuse every stage up to the plot.
+# pandas and matplotlib are imported by the stages that use them, so a new
+# worker that stops early (bad token, no runs) never pays for loading them.
+
+@st.cache_data(ttl=SYNC_INTERVAL_SEC, show_spinner=False)
+def sync_stage(access_token):
+    # A failed sync is cached like a successful one, so throttled or offline
+    # sessions retry once per SYNC_INTERVAL_SEC rather than on every rerun
+    conn = activity_db.connect()
+    athlete_id, sync_error = sync_activities(conn, access_token)
+    return athlete_id, activity_db.get_data_version(conn, athlete_id), sync_error
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def runs_stage(athlete_id, data_version):
+    return load_runs(activity_db.connect(), athlete_id)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def runs_table_stage(athlete_id, data_version):
+    df = runs_stage(athlete_id, data_version)
+    return df[["name", "date", "distance_km", "moving_time_min"]].assign(pace=seconds_to_pace(df["pace_sec_per_km"])).rename(columns={
+        "name": "Name",
+        "date": "Date",
+        "distance_km": "Distance (km)",
+        "moving_time_min": "Time (min)",
+        "pace": "Pace"
+    })
+
+def rollups_frame(rows, index):
+    # Missing periods (no runs) become NaN so charts show gaps, not zeros
+    import pandas as pd
+
+    rollups = pd.DataFrame(rows, columns=["period_start", "run_count", "distance", "moving_time", "longest_distance"])
+    rollups = rollups.set_index(pd.to_datetime(rollups["period_start"])).drop(columns="period_start").reindex(index)
+    rollups["distance_km"] = rollups["distance"] / 1000
+    rollups["pace_sec_per_km"] = aggregation.weighted_pace(rollups["moving_time"], rollups["distance_km"])
+    return rollups
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def weekly_pace_stage(athlete_id, data_version, today):
+    # Monday-aligned weekly bins over [today - 12 weeks, today], which stay
+    # correct across New Year unlike filtering on ISO year / week number
+    import pandas as pd
+
+    current_week_start = pd.Timestamp(today) - pd.Timedelta(days=today.weekday())
+    start = current_week_start - pd.Timedelta(weeks=PACE_TREND_WEEKS)
+
+    # Read the pre-aggregated weekly rollups instead of scanning every run
+    rows = activity_db.get_rollups(activity_db.connect(), athlete_id, "week",
+                                   start.date().isoformat(), current_week_start.date().isoformat())
+    weekly_pace = rollups_frame(rows, pd.date_range(start, current_week_start, freq="W-MON"))
+    weekly_pace = weekly_pace.rename_axis("week_start").reset_index()
+
+    # Convert seconds to min/km
+    weekly_pace["pace_min_per_km"] = weekly_pace["pace_sec_per_km"] / 60
+    return weekly_pace
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def monthly_summary_stage(athlete_id, data_version, today):
+    import pandas as pd
+
+    current_month_start = pd.Timestamp(today).replace(day=1)
+    start = current_month_start - pd.DateOffset(months=MONTHLY_SUMMARY_MONTHS - 1)
+    rows = activity_db.get_rollups(activity_db.connect(), athlete_id, "month",
+                                   start.date().isoformat(), current_month_start.date().isoformat())
+    monthly = rollups_frame(rows, pd.date_range(start, current_month_start, freq="MS"))
+    monthly = monthly.iloc[::-1].fillna({"run_count": 0, "distance_km": 0})
+    return pd.DataFrame({
+        "Month": monthly.index.strftime("%b %Y"),
+        "Runs": monthly["run_count"].astype(int),
+        "Distance (km)": monthly["distance_km"].round(1),
+        "Pace": seconds_to_pace(monthly["pace_sec_per_km"]).values,
+        "Longest (km)": (monthly["longest_distance"] / 1000).round(1)
+    })
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def recent_runs_stage(athlete_id, data_version, today):
+    # The stored history goes back years; "recent" is the last RECENT_WEEKS
+    df = runs_stage(athlete_id, data_version)
+    since = np.datetime64(today - timedelta(weeks=RECENT_WEEKS))
+    return df[df["date"] >= since]
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def long_runs_stage(athlete_id, data_version, today):
+    # Counted on the distances themselves, so LONG_RUN_KM need not be a bucket edge
+    recent_runs = recent_runs_stage(athlete_id, data_version, today)
+    return int((recent_runs["distance_km"] > LONG_RUN_KM).sum())
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def best_efforts_stage(athlete_id, data_version, streams_version):
+    # Fastest window over each race distance within any run, from the streams
+    import pandas as pd
+
+    # Chunk by chunk, decoding only the two streams the scan needs
+    best, activity_ids = [], []
+    for streams in streams_store.iter_streams(athlete_id, columns=("time", "distance")):
+        best.append(stream_metrics.best_efforts(streams, [km * 1000 for km in RACE_DISTANCES.values()]))
+        activity_ids.append(streams["activity_id"])
+    if not best:
+        return None
+    best = np.concatenate(best)
+    activity_ids = np.concatenate(activity_ids)
+    runs = runs_stage(athlete_id, data_version).set_index("id")
+
+    rows = []
+    for column, (race, km) in enumerate(RACE_DISTANCES.items()):
+        if np.isnan(best[:, column]).all():
+            continue
+        i = int(np.nanargmin(best[:, column]))
+        activity_id = activity_ids[i]
+        run = runs.loc[activity_id] if activity_id in runs.index else None
+        rows.append({
+            "Distance": race,
+            "Time": seconds_to_duration(best[i, column]),
+            "Pace": seconds_to_pace(best[i, column] / km),
+            "Run": run["name"] if run is not None else str(activity_id),
+            "Date": run["date"] if run is not None else pd.NaT
+        })
+    return pd.DataFrame(rows, columns=["Distance", "Time", "Pace", "Run", "Date"])
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def splits_stage(athlete_id, activity_id, unit):
+    # Cached per activity and unit, so browsing back and forth is instant.
+    # Stored streams never change, so the streams version is not part of the key.
+    import pandas as pd
+
+    streams = streams_store.load_streams(athlete_id, [activity_id])
+    if streams is None or len(streams["time"]) < 2 or np.isnan(streams["distance"]).any():
+        return None
+    splits = stream_metrics.splits(streams, SPLIT_UNITS[unit])
+    return pd.DataFrame({
+        "Split": np.arange(1, len(splits["distance_m"]) + 1),
+        f"Distance ({unit})": (splits["distance_m"] / SPLIT_UNITS[unit]).round(2),
+        "Time": [seconds_to_duration(sec) for sec in splits["elapsed_sec"]],
+        "Pace": seconds_to_pace(splits["elapsed_sec"] / (splits["distance_m"] / SPLIT_UNITS[unit]), unit),
+        "Avg HR": splits["average_hr"].round(),
+        "Elevation (m)": splits["elevation_m"].round(1)
+    })
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def race_predictions_stage(athlete_id, streams_version):
+    import pandas as pd
+
+    curve = streams_store.update_speed_curve(activity_db.connect(), athlete_id)
+    predicted = stream_metrics.predict_race_times(curve, [km * 1000 for km in RACE_DISTANCES.values()])
+    if np.isnan(predicted).all():
+        return None
+    return pd.DataFrame({
+        "Race": list(RACE_DISTANCES),
+        "Predicted Time": [seconds_to_duration(sec) for sec in predicted],
+        "Pace": seconds_to_pace(predicted / np.array(list(RACE_DISTANCES.values())))
+    })
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def weekly_intensity_stage(athlete_id, streams_version, today, target_pace_sec):
+    # Weekly time in zone summed from the per-activity histograms, so no
+    # stream is read here; zones are applied to the summed bins
+    import pandas as pd
+
+    conn = activity_db.connect()
+    streams_store.update_zone_histograms(conn, athlete_id)
+    rows = activity_db.load_zone_histograms(conn, athlete_id)
+    if not rows:
+        return None
+    dates = np.array([row[0][:10] for row in rows], dtype="datetime64[D]")
+    hr = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    pace = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+
+    current_week_start = np.datetime64(today) - np.timedelta64(today.weekday(), "D")
+    start = current_week_start - np.timedelta64(7 * PACE_TREND_WEEKS, "D")
+    weeks = pd.date_range(start, current_week_start, freq="W-MON")
+    week = (dates - start).astype(np.int64) // 7
+    in_range = (week >= 0) & (week < len(weeks))
+
+    def weekly_minutes(histograms, bin_edges, zone_upper_edges):
+        zones = stream_metrics.zone_times(histograms[in_range], bin_edges, zone_upper_edges)
+        minutes = np.zeros((len(weeks), zones.shape[1]))
+        np.add.at(minutes, week[in_range], zones / 60)
+        return minutes
+
+    def table(minutes, zone_names):
+        frame = pd.DataFrame(minutes.round().astype(int), columns=zone_names)
+        return frame.assign(Week=weeks)[["Week"] + zone_names].iloc[::-1]
+
+    intensity = {"heartrate": None, "pace": None, "effort": None}
+    max_hr = MAX_HEARTRATE or stream_metrics.estimate_max_heartrate(hr.sum(axis=0))
+    if max_hr is not None:
+        hr_minutes = weekly_minutes(hr, stream_metrics.HR_BIN_EDGES, np.array(list(HR_ZONES.values())) * max_hr)
+        intensity["heartrate"] = table(hr_minutes, list(HR_ZONES))
+        recent = hr_minutes[-EFFORT_WEEKS:].sum(axis=0)
+        if recent.sum() > 0:
+            intensity["effort"] = {"easy_share": recent[:2].sum() / recent.sum(),
+                                   "hard_share": recent[3:].sum() / recent.sum()}
+    if target_pace_sec is not None:
+        pace_minutes = weekly_minutes(pace, stream_metrics.PACE_BIN_EDGES,
+                                      np.array(list(PACE_ZONES.values())) * target_pace_sec)
+        intensity["pace"] = table(pace_minutes, list(PACE_ZONES))
+    return intensity
+
+def chart_points(frame, column, envelope=False, x="week_start"):
+    # Every chart goes through here. Line charts keep their shape with LTTB;
+    # bar charts keep each bucket's extremes so no peak week disappears
+    if envelope:
+        keep = downsample.min_max_indices(frame[column], CHART_MAX_POINTS)
+    else:
+        keep = downsample.lttb_indices(frame[x], frame[column], CHART_MAX_POINTS)
+    return frame.iloc[keep]
+
+def figure_bytes(fig):
+    # Same options as st.pyplot. The figure is built with Figure() rather than
+    # pyplot, so no global registry holds on to it, and it is cleared here so
+    # nothing but the bytes outlives the render
+    image = io.BytesIO()
+    try:
+        fig.savefig(image, format=CHART_FORMAT, dpi=200, bbox_inches="tight")
+    finally:
+        fig.clear()
+    return image.getvalue().decode() if CHART_FORMAT == "svg" else image.getvalue()
+
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)
+def pace_chart_stage(athlete_id, data_version, today, target_pace_sec, target_pace_formatted):
+    weekly_pace = chart_points(weekly_pace_stage(athlete_id, data_version, today), "pace_min_per_km")
+
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(weekly_pace["week_start"], weekly_pace["pace_min_per_km"], marker='o', linestyle='-', label='Weekly Pace')
+    if target_pace_sec is not None:
+        ax.axhline(y=target_pace_sec/60, color='red', linestyle='--', label=f'Target Pace ({target_pace_formatted})')
+
+    ax.set_xlabel("Week Starting")
+    fig.autofmt_xdate()
+    ax.set_ylabel("Pace (min/km)")
+    ax.set_title("Weekly Pace vs Target Pace")
+    ax.grid(True)
+    ax.invert_yaxis()
+    ax.legend()
+
+    # Rendered once per (data version, day, target pace); reruns reuse the bytes
+    return figure_bytes(fig)
+
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)
+def load_chart_stage(athlete_id, data_version, today):
+    weekly_pace = chart_points(weekly_pace_stage(athlete_id, data_version, today), "distance_km", envelope=True)
+
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.bar(weekly_pace["week_start"], weekly_pace["distance_km"].fillna(0), width=5)
+    ax.set_xlabel("Week Starting")
+    fig.autofmt_xdate()
+    ax.set_ylabel("Distance (km)")
+    ax.set_title("Weekly Distance")
+    ax.grid(True, axis="y")
+    return figure_bytes(fig)
+
+# --- CLIENT-SIDE CHARTS ---
+# With CHART_BACKEND = "vega-lite" the server only ships the weekly series as
+# inline JSON (a dozen rows) and the browser renders it with Vega-Lite.
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def weekly_chart_values(athlete_id, data_version, today, column, envelope=False):
+    import pandas as pd
+
+    weekly_pace = chart_points(weekly_pace_stage(athlete_id, data_version, today), column, envelope)
+    pace = weekly_pace["pace_min_per_km"].round(3)
+    return pd.DataFrame({
+        "week_start": weekly_pace["week_start"].dt.strftime("%Y-%m-%d"),
+        "pace": pace.astype(object).where(pace.notna(), None),
+        "pace_label": seconds_to_pace(weekly_pace["pace_sec_per_km"]).values,
+        "distance_km": weekly_pace["distance_km"].fillna(0).round(1),
+        "runs": weekly_pace["run_count"].fillna(0).astype(int)
+    }).to_dict("records")
+
+# Drag to pan and scroll to zoom on the time axis, entirely in the browser
+ZOOM_PARAM = {"name": "zoom", "select": {"type": "interval", "encodings": ["x"]}, "bind": "scales"}
+
+WEEK_AXIS = {"field": "week_start", "type": "temporal", "title": "Week Starting"}
+
+def pace_chart_spec(values, target_pace_sec, target_pace_formatted):
+    layers = [{
+        "mark": {"type": "line", "point": True},
+        "params": [ZOOM_PARAM],
+        "encoding": {
+            "x": WEEK_AXIS,
+            "y": {"field": "pace", "type": "quantitative", "title": "Pace (min/km)",
+                  "scale": {"reverse": True, "zero": False}},
+            "tooltip": [{"field": "week_start", "type": "temporal", "title": "Week"},
+                        {"field": "pace_label", "type": "nominal", "title": "Pace"},
+                        {"field": "runs", "type": "quantitative", "title": "Runs"}]
+        }
+    }]
+    if target_pace_sec is not None:
+        layers.append({
+            "mark": {"type": "rule", "color": "red", "strokeDash": [6, 4]},
+            "encoding": {"y": {"datum": round(target_pace_sec / 60, 3)},
+                         "tooltip": {"value": f"Target Pace ({target_pace_formatted})"}}
+        })
+    return {"title": "Weekly Pace vs Target Pace", "data": {"values": values}, "layer": layers}
+
+def load_chart_spec(values):
+    return {
+        "title": "Weekly Distance",
+        "data": {"values": values},
+        "mark": "bar",
+        "params": [ZOOM_PARAM],
+        "encoding": {
+            "x": {**WEEK_AXIS, "timeUnit": "yearmonthdate"},
+            "y": {"field": "distance_km", "type": "quantitative", "title": "Distance (km)"},
+            "tooltip": [{"field": "week_start", "type": "temporal", "title": "Week"},
+                        {"field": "distance_km", "type": "quantitative", "title": "Distance (km)"},
+                        {"field": "runs", "type": "quantitative", "title": "Runs"}]
+        }
+    }
 
 # --- STREAMLIT DASHBOARD START ---
 
 st.set_page_config(page_title="AI Running Coach", page_icon="🏃‍♂️", layout="wide")
 
+# Read access token from Streamlit secrets
+access_token = st.secrets["access_token"]
+
+# Sync new activities into the local database; goals are stored per athlete
+try:
+    athlete_id, data_version, sync_error = sync_stage(access_token)
+except StravaUnavailable as e:
+    st.error(str(e))
+    st.stop()
+if sync_error:
+    st.warning(f"{sync_error}. Showing your stored activities.")
+
 # Load previous goal if exists
-goal_data = load_goal()
+goal_data = goal_store.load_goal(athlete_id)
 
 # --- Sidebar: Set / Update Goal ---
 st.sidebar.header("🏁 Set Your Goal")
@@ -129,97 +662,107 @@ current_goal_data = {
     "target_pace_sec": target_pace_sec,
     "target_pace_formatted": target_pace_formatted
 }
-save_goal(current_goal_data)
+goal_store.save_goal(athlete_id, current_goal_data)
 
 # --- Main Section ---
 
 st.title("🏃 AI Running Coach Dashboard")
 
-# Read access token from Streamlit secrets
-access_token = st.secrets["access_token"]
-
+# Load the prepared runs
+df = runs_stage(athlete_id, data_version)
 
-# Fetch and prepare runs
-activities = fetch_activities(access_token)
-runs = [act for act in activities if act.get("type") == "Run"]
-
-if not runs:
+if df is None:
     st.warning("No recent running activities found.")
     st.stop()
 
-# Prepare dataframe
-data = []
-for act in runs:
-    dist_km = act["distance"] / 1000
-    pace_sec_per_km = calculate_pace(act["moving_time"], act["distance"])
-    data.append({
-        "name": act["name"],
-        "date": act["start_date_local"][:10],
-        "distance_km": dist_km,
-        "moving_time_min": act["moving_time"] / 60,
-        "pace_sec_per_km": pace_sec_per_km
-    })
-
-df = pd.DataFrame(data)
-
 # --- Section: Recent Runs Table ---
 st.subheader("📄 Recent Runs")
-st.dataframe(df[["name", "date", "distance_km", "moving_time_min"]].rename(columns={
-    "name": "Name",
-    "date": "Date",
-    "distance_km": "Distance (km)",
-    "moving_time_min": "Time (min)"
-}), hide_index=True)
+st.dataframe(runs_table_stage(athlete_id, data_version), hide_index=True,
+             column_config={"Date": st.column_config.DateColumn()})
+
+# --- Splits for one run ---
+streamed_ids = set(streams_store.stored_activity_ids(athlete_id))
+streamed_runs = df[df["id"].isin(streamed_ids)]
+with st.expander("⏱️ Splits"):
+    if streamed_runs.empty:
+        st.caption("Splits appear once your activity streams have been downloaded from Strava.")
+    else:
+        run_labels = dict(zip(streamed_runs["id"],
+                              streamed_runs["name"] + " – " + streamed_runs["date"].dt.strftime("%Y-%m-%d")))
+        split_run = st.selectbox("Run:", list(run_labels), format_func=run_labels.get)
+        split_unit = st.radio("Split every:", list(SPLIT_UNITS), horizontal=True)
+        split_table = splits_stage(athlete_id, int(split_run), split_unit)
+        if split_table is None:
+            st.caption("This run has no distance stream to split.")
+        else:
+            st.dataframe(split_table, hide_index=True)
+
+# --- Section: Best Efforts ---
+st.subheader("🏅 Best Efforts")
+best_efforts = best_efforts_stage(athlete_id, data_version, streams_store.get_streams_version(athlete_id))
+if best_efforts is None or best_efforts.empty:
+    st.caption("Best efforts appear once your activity streams have been downloaded from Strava.")
+else:
+    st.dataframe(best_efforts, hide_index=True, column_config={"Date": st.column_config.DateColumn()})
+
+# --- Section: Race Predictions ---
+race_predictions = race_predictions_stage(athlete_id, streams_store.get_streams_version(athlete_id))
+if race_predictions is not None:
+    st.subheader("🔮 Race Predictions")
+    st.dataframe(race_predictions, hide_index=True)
+    st.caption("From your best average pace over every duration up to 3 hours, across all streamed runs.")
 
 # --- Section: Moving Average Pace Over Last 12 Weeks ---
 st.subheader("📈 Pace Trend Over Last 12 Weeks")
 
-# Prepare dates and weeks
-df["date_obj"] = pd.to_datetime(df["date"])
-df["week"] = df["date_obj"].dt.isocalendar().week
-df["year"] = df["date_obj"].dt.isocalendar().year
-
-# Group by week
-weekly_pace = df.groupby(["year", "week"]).agg({"pace_sec_per_km": "mean"}).reset_index()
-
-# Only keep last 12 weeks
-today = datetime.today()
-current_year = today.isocalendar().year
-current_week = today.isocalendar().week
-
-# Filter: within last 12 weeks
-weekly_pace = weekly_pace[
-    (weekly_pace["year"] == current_year) & 
-    (weekly_pace["week"] >= current_week - 12)
-]
-
-# Convert seconds to min/km
-weekly_pace["pace_min_per_km"] = weekly_pace["pace_sec_per_km"] / 60
-
 # --- Plot ---
-fig, ax = plt.subplots()
-ax.plot(weekly_pace["week"], weekly_pace["pace_min_per_km"], marker='o', linestyle='-', label='Weekly Avg Pace')
-ax.axhline(y=current_goal_data["target_pace_sec"]/60, color='red', linestyle='--', label=f'Target Pace ({current_goal_data["target_pace_formatted"]})')
-
-ax.set_xlabel("Week Number")
-ax.set_ylabel("Average Pace (min/km)")
-ax.set_title("Weekly Average Pace vs Target Pace")
-ax.grid(True)
-ax.invert_yaxis()
-ax.legend()
+today = datetime.today().date()
+if CHART_BACKEND == "vega-lite":
+    st.vega_lite_chart(spec=pace_chart_spec(weekly_chart_values(athlete_id, data_version, today, "pace_min_per_km"),
+                                            current_goal_data["target_pace_sec"],
+                                            current_goal_data["target_pace_formatted"]),
+                       width="stretch")
+else:
+    st.image(pace_chart_stage(athlete_id, data_version, today,
+                              current_goal_data["target_pace_sec"], current_goal_data["target_pace_formatted"]),
+             width="stretch")
 
-st.pyplot(fig)
 
+# --- Section: Monthly Summary ---
+st.subheader("📅 Monthly Summary")
+st.dataframe(monthly_summary_stage(athlete_id, data_version, today), hide_index=True)
 
 # --- Section: Training Load Progress ---
-long_runs = df[df["distance_km"] > 10]
-completed_long_runs = long_runs.shape[0]
+completed_long_runs = long_runs_stage(athlete_id, data_version, today)
 weeks_to_race = (datetime.strptime(current_goal_data["race_date"], "%Y-%m-%d").date() - datetime.today().date()).days // 7
 expected_long_runs = max(1, weeks_to_race)
 training_load = min(1.0, completed_long_runs / expected_long_runs)
 
 st.subheader("📊 Training Load Progress")
 st.progress(training_load)
+if CHART_BACKEND == "vega-lite":
+    st.vega_lite_chart(spec=load_chart_spec(weekly_chart_values(athlete_id, data_version, today,
+                                                                 "distance_km", envelope=True)), width="stretch")
+else:
+    st.image(load_chart_stage(athlete_id, data_version, today), width="stretch")
+
+# --- Section: Training Intensity ---
+intensity = weekly_intensity_stage(athlete_id, streams_store.get_streams_version(athlete_id), today,
+                                   current_goal_data["target_pace_sec"])
+if intensity is not None:
+    st.subheader("❤️ Training Intensity (minutes per week)")
+    hr_tab, pace_tab = st.tabs(["Heart-rate zones", "Pace zones"])
+    week_column = {"Week": st.column_config.DateColumn()}
+    with hr_tab:
+        if intensity["heartrate"] is not None:
+            st.dataframe(intensity["heartrate"], hide_index=True, column_config=week_column)
+        else:
+            st.caption("No heart-rate data in your streamed runs yet.")
+    with pace_tab:
+        if intensity["pace"] is not None:
+            st.dataframe(intensity["pace"], hide_index=True, column_config=week_column)
+        else:
+            st.caption("Set a valid target time to see pace zones.")
 
 # --- Section: Training Plan ---
 st.subheader("🛠️ Training Plan")
@@ -237,6 +780,7 @@ st.subheader("🤖 Ask the AI Analyst")
 user_question = st.text_input("Ask me about your training, pace, or readiness:")
 
 if user_question:
-    response = ai_analyst_response(user_question, current_goal_data, df)
+    response = ai_analyst_response(user_question, current_goal_data, recent_runs_stage(athlete_id, data_version, today),
+                                   intensity["effort"] if intensity is not None else None)
     st.info(response)
 
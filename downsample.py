@@ -0,0 +1,69 @@
+import numpy as np
+
+# --- CONFIGURATION ---
+
+# Points kept per chart series, a couple per horizontal pixel of a wide chart
+MAX_CHART_POINTS = 1000
+
+# --- HELPERS ---
+
+def as_float(values):
+    # Dates are downsampled on their epoch seconds
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("datetime64[s]").astype(np.int64)
+    return values.astype(np.float64)
+
+# --- DOWNSAMPLERS ---
+# Both return the sorted row positions to keep. Series already within the
+# budget are kept whole, gaps included; longer ones are reduced over their
+# finite points only.
+
+def lttb_indices(x, y, budget=MAX_CHART_POINTS):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point, and from
+    # each bucket in between the point forming the largest triangle with the
+    # previous pick and the next bucket's mean, which preserves peaks and dips
+    x, y = as_float(x), as_float(y)
+    if len(y) <= budget:
+        return np.arange(len(y))
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(finite)
+    if n <= max(budget, 2):
+        return finite
+    x, y = x[finite], y[finite]
+
+    # budget - 2 buckets over the interior points, with their means
+    edges = np.linspace(1, n - 1, max(budget, 3) - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+    # The last bucket looks ahead to the final point
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    keep = np.empty(len(sizes) + 2, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        area = np.abs((x[a] - mean_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return finite[keep]
+
+def min_max_indices(y, budget=MAX_CHART_POINTS):
+    # Min/max envelope: the lowest and highest point of each of budget / 2
+    # equal buckets, so no spike disappears, in one sort
+    y = as_float(y)
+    if len(y) <= budget:
+        return np.arange(len(y))
+    finite = np.flatnonzero(np.isfinite(y))
+    n = len(finite)
+    if n <= budget:
+        return finite
+    y = y[finite]
+
+    edges = np.linspace(0, n, max(budget // 2, 1) + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+    order = np.lexsort((y, bucket))
+    keep = np.union1d(order[edges[:-1]], order[edges[1:] - 1])
+    return finite[keep]
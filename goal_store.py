@@ -0,0 +1,119 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+import activity_db
+
+# --- CONFIGURATION ---
+
+# Goals live next to the activities, one row per athlete
+DB_FILE = activity_db.DB_FILE
+
+# Pending goal changes are written together at most this often
+FLUSH_INTERVAL_SEC = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS goals (
+    athlete_id INTEGER PRIMARY KEY,
+    goal TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# --- STORE ---
+
+class GoalStore:
+    # Reads are served from memory after the first lookup per athlete.
+    # Writes are coalesced per athlete and flushed in one transaction by a
+    # single background thread, so many sessions never contend on SQLite.
+
+    def __init__(self, path=DB_FILE, flush_interval=FLUSH_INTERVAL_SEC):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.cache = {}
+        self.pending = {}
+        self.flush_requested = threading.Event()
+        self.flusher = None
+        self.schema_ready = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self.schema_ready = True
+        return conn
+
+    def load(self, athlete_id):
+        with self.lock:
+            if athlete_id in self.cache:
+                return self.cache[athlete_id]
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT goal FROM goals WHERE athlete_id = ?", (athlete_id,)).fetchone()
+        finally:
+            conn.close()
+        goal = json.loads(row[0]) if row else None
+        with self.lock:
+            # A save may have landed while we were reading
+            return self.cache.setdefault(athlete_id, goal)
+
+    def save(self, athlete_id, goal):
+        if self.load(athlete_id) == goal:
+            return
+        with self.lock:
+            self.cache[athlete_id] = goal
+            self.pending[athlete_id] = goal
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run_flusher, name="goal-store-flusher", daemon=True)
+                self.flusher.start()
+        self.flush_requested.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            now = time.time()
+            rows = [(athlete_id, json.dumps(goal), now) for athlete_id, goal in pending.items()]
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO goals (athlete_id, goal, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT (athlete_id) DO UPDATE SET goal = excluded.goal, updated_at = excluded.updated_at
+                    """, rows)
+            except sqlite3.Error:
+                # Keep the changes for the next flush unless newer ones arrived
+                with self.lock:
+                    for athlete_id, goal in pending.items():
+                        self.pending.setdefault(athlete_id, goal)
+                raise
+            finally:
+                conn.close()
+
+    def run_flusher(self):
+        while True:
+            self.flush_requested.wait()
+            self.flush_requested.clear()
+            # Let other sessions' edits from the same burst join this batch
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                self.flush_requested.set()
+
+# Shared by every Streamlit session in this process
+store = GoalStore()
+atexit.register(store.flush)
+
+def load_goal(athlete_id):
+    return store.load(athlete_id)
+
+def save_goal(athlete_id, goal):
+    store.save(athlete_id, goal)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+
+# --- CONFIGURATION ---
+
+# Directory holding cached Strava response bodies and their validators
+CACHE_DIR = "http_cache"
+
+# Disk budget; least recently used entries are evicted past it
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+# Parsed payloads kept in memory so a 304 does not re-parse the body
+MAX_PARSED_ENTRIES = 64
+
+# --- CACHE KEYS ---
+
+def cache_key(url, params=None, headers=None):
+    # Responses are per athlete, so the token is part of the key (hashed)
+    parts = [url, json.dumps(sorted((params or {}).items()), default=str)]
+    parts.append((headers or {}).get("Authorization", ""))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+def entry_paths(key):
+    return os.path.join(CACHE_DIR, f"{key}.meta"), os.path.join(CACHE_DIR, f"{key}.body")
+
+# --- DISK CACHE ---
+
+def lookup(key):
+    meta_path, _ = entry_paths(key)
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def validators(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def write_atomic(path, data, mode="wb"):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def store(key, response):
+    entry = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    if not entry["etag"] and not entry["last_modified"]:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    meta_path, body_path = entry_paths(key)
+    write_atomic(body_path, response.content)
+    write_atomic(meta_path, json.dumps(entry), mode="w")
+    evict()
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".body"):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name[:-5]))
+        total += stat.st_size
+    # Hits touch the body file, so oldest mtime is least recently used
+    for _, size, key in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in entry_paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+# --- CACHED RESPONSES ---
+
+parsed_payloads = OrderedDict()
+parsed_payloads_lock = threading.Lock()
+
+class CachedResponse(requests.Response):
+    # Stands in for a 200 when Strava answers 304 Not Modified
+
+    def __init__(self, cache_key, etag, body):
+        super().__init__()
+        self.status_code = 200
+        self._content = body
+        self.from_cache = True
+        self.parsed_key = (cache_key, etag)
+
+    def json(self, **kwargs):
+        with parsed_payloads_lock:
+            if self.parsed_key in parsed_payloads:
+                parsed_payloads.move_to_end(self.parsed_key)
+                return parsed_payloads[self.parsed_key]
+        payload = super().json(**kwargs)
+        with parsed_payloads_lock:
+            parsed_payloads[self.parsed_key] = payload
+            while len(parsed_payloads) > MAX_PARSED_ENTRIES:
+                parsed_payloads.popitem(last=False)
+        return payload
+
+def cached_response(key, entry):
+    _, body_path = entry_paths(key)
+    try:
+        with open(body_path, "rb") as f:
+            body = f.read()
+        os.utime(body_path)
+    except OSError:
+        return None
+    return CachedResponse(key, entry.get("etag") or entry.get("last_modified"), body)
@@ -0,0 +1,55 @@
+import os
+
+import arrow_parts
+
+# --- CONFIGURATION ---
+
+# Directory holding one Arrow dataset of prepared runs per athlete
+CACHE_DIR = "runs_cache"
+
+# Bump when the prepared runs columns change so stale caches are rebuilt
+CACHE_VERSION = 3
+
+# --- HELPERS ---
+
+def athlete_dir(athlete_id):
+    return os.path.join(CACHE_DIR, f"v{CACHE_VERSION}", str(athlete_id))
+
+def dedupe_runs(df):
+    # Later parts win when an activity was re-synced after an edit
+    return df.drop_duplicates("id", keep="last").sort_values("date", ascending=False, kind="stable")
+
+def read_runs(parts):
+    import pyarrow as pa
+
+    if not parts:
+        return None
+    table = pa.concat_tables([arrow_parts.open_part(path).read_all() for path in parts])
+    return dedupe_runs(table.to_pandas()).reset_index(drop=True)
+
+def runs_table(runs_df):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(runs_df, preserve_index=False)
+
+def merge_runs(parts):
+    # Oldest first, like appended parts, so the newest run stays last
+    table = runs_table(read_runs(parts).iloc[::-1])
+    return table.schema, table.to_batches()
+
+# --- CACHE ---
+
+def has_runs(athlete_id):
+    return bool(arrow_parts.list_parts(athlete_dir(athlete_id)))
+
+def load_runs(athlete_id):
+    return arrow_parts.read_parts(athlete_dir(athlete_id), read_runs)
+
+def append_runs(athlete_id, runs_df):
+    if runs_df is None or runs_df.empty:
+        return
+    table = runs_table(runs_df)
+    arrow_parts.append_part(athlete_dir(athlete_id), table.schema, table.to_batches(), merge_runs)
+
+def compact_runs(athlete_id):
+    arrow_parts.compact_parts(athlete_dir(athlete_id), merge_runs)
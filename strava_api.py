@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+import http_cache
+
+# --- CONFIGURATION ---
+
+# Request priorities: lower runs first
+INTERACTIVE = 0  # a dashboard page is waiting on the response
+BACKFILL = 1  # bulk history / detail fetches that can wait
+
+# Strava's default read limits, used until the first response reports real ones
+DEFAULT_LIMITS = (100, 1000)  # (per 15 minutes, per day)
+SHORT_WINDOW_SEC = 15 * 60
+DAILY_WINDOW_SEC = 24 * 60 * 60
+
+# Share of each window kept free for interactive requests
+BACKFILL_RESERVE = 0.2
+
+# Interactive requests give up rather than wait out a whole window
+INTERACTIVE_MAX_WAIT_SEC = 10
+
+# Retries on 429 / 5xx / connection errors, with exponential backoff and jitter
+MAX_RETRIES = 4
+BACKOFF_BASE_SEC = 1
+BACKOFF_MAX_SEC = 60
+
+# Keep-alive connections kept open to Strava, shared by all sessions
+HTTP_POOL_SIZE = 16
+
+# --- RATE LIMITING ---
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Strava rate limit reached, retry in {int(retry_after)} seconds")
+        self.retry_after = retry_after
+
+def parse_rate_limit_header(value):
+    try:
+        short, daily = (int(part) for part in value.split(","))
+        return short, daily
+    except (AttributeError, ValueError):
+        return None
+
+class RateLimitScheduler:
+    # Tracks Strava's 15-minute and daily quotas for the whole process and
+    # hands out request slots in priority order.
+
+    def __init__(self, limits=DEFAULT_LIMITS):
+        self.cond = threading.Condition()
+        self.limits = limits
+        self.usage = [0, 0]
+        self.windows = self.window_starts(time.time())
+        self.waiting = []
+        self.tickets = itertools.count()
+
+    def window_starts(self, now):
+        # Strava's short window resets on the quarter hour, the daily one at midnight UTC
+        return (now - now % SHORT_WINDOW_SEC, now - now % DAILY_WINDOW_SEC)
+
+    def roll_windows(self, now):
+        windows = self.window_starts(now)
+        for i in range(2):
+            if windows[i] != self.windows[i]:
+                self.usage[i] = 0
+        self.windows = windows
+
+    def has_quota(self, priority):
+        reserve = BACKFILL_RESERVE if priority >= BACKFILL else 0
+        return all(self.usage[i] < self.limits[i] * (1 - reserve) for i in range(2))
+
+    def seconds_until_quota(self, now, priority):
+        reserve = BACKFILL_RESERVE if priority >= BACKFILL else 0
+        if self.usage[1] >= self.limits[1] * (1 - reserve):
+            return self.windows[1] + DAILY_WINDOW_SEC - now
+        return self.windows[0] + SHORT_WINDOW_SEC - now
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        deadline = None if max_wait is None else time.time() + max_wait
+        with self.cond:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    self.roll_windows(now)
+                    timeout = None
+                    if self.waiting[0] == ticket:
+                        if self.has_quota(priority):
+                            heapq.heappop(self.waiting)
+                            self.usage = [self.usage[0] + 1, self.usage[1] + 1]
+                            self.cond.notify_all()
+                            return
+                        timeout = self.seconds_until_quota(now, priority)
+                        if deadline is not None and now + timeout > deadline:
+                            raise RateLimitExceeded(timeout)
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise RateLimitExceeded(self.seconds_until_quota(now, priority))
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+                    self.cond.wait(timeout)
+            except BaseException:
+                if ticket in self.waiting:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                self.cond.notify_all()
+                raise
+
+    def update(self, headers):
+        # Reads have their own, lower quota when Strava reports one
+        limits = parse_rate_limit_header(headers.get("X-ReadRateLimit-Limit") or headers.get("X-RateLimit-Limit"))
+        usage = parse_rate_limit_header(headers.get("X-ReadRateLimit-Usage") or headers.get("X-RateLimit-Usage"))
+        with self.cond:
+            if limits:
+                self.limits = limits
+            if usage:
+                self.roll_windows(time.time())
+                # In-flight requests may not be counted by the server yet
+                self.usage = [max(local, reported) for local, reported in zip(self.usage, usage)]
+            self.cond.notify_all()
+
+    def exhaust_short_window(self):
+        with self.cond:
+            self.usage[0] = max(self.usage[0], self.limits[0])
+
+    def request(self, send, priority=INTERACTIVE, max_wait=None):
+        if max_wait is None and priority == INTERACTIVE:
+            max_wait = INTERACTIVE_MAX_WAIT_SEC
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire(priority, max_wait)
+            try:
+                response = send()
+            except requests.ConnectionError:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.update(response.headers)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == MAX_RETRIES:
+                return response
+            if response.status_code == 429:
+                self.exhaust_short_window()
+            time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+
+def backoff_delay(attempt, retry_after=None):
+    try:
+        return min(float(retry_after), BACKOFF_MAX_SEC)
+    except (TypeError, ValueError):
+        # Full jitter keeps concurrent sessions from retrying in lockstep
+        return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+
+# Shared by every Streamlit session in this process
+scheduler = RateLimitScheduler()
+
+# --- REQUESTS ---
+
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_session(pool_size=HTTP_POOL_SIZE):
+    # Created once per process so every rerun and athlete reuses the same
+    # keep-alive connections instead of paying a TLS handshake per call
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            http_session = session
+        return http_session
+
+def get(url, headers=None, params=None, priority=INTERACTIVE, cache=True, max_wait=None):
+    # cache=False for large responses the caller stores itself, e.g. streams.
+    # max_wait bounds the wait for quota (interactive requests default to
+    # INTERACTIVE_MAX_WAIT_SEC); past it RateLimitExceeded is raised
+    session = get_session()
+    key = http_cache.cache_key(url, params, headers)
+    entry = http_cache.lookup(key) if cache else None
+    request_headers = dict(headers or {})
+    if entry is not None:
+        request_headers.update(http_cache.validators(entry))
+    response = scheduler.request(lambda: session.get(url, headers=request_headers, params=params), priority, max_wait)
+
+    if response.status_code == 304:
+        cached = http_cache.cached_response(key, entry) if entry is not None else None
+        if cached is not None:
+            return cached
+        # The cached body went missing, so ask again without validators
+        response = scheduler.request(lambda: session.get(url, headers=headers, params=params), priority, max_wait)
+    if response.status_code == 200 and cache:
+        http_cache.store(key, response)
+    return response
@@ -0,0 +1,84 @@
+import asyncio
+
+import strava_api
+
+# --- CONFIGURATION ---
+
+STRAVA_ACTIVITY_URL = "https://www.strava.com/api/v3/activities/{activity_id}"
+STRAVA_STREAMS_URL = "https://www.strava.com/api/v3/activities/{activity_id}/streams"
+
+# Streams requested per activity
+STREAM_KEYS = ["time", "distance", "heartrate", "altitude", "cadence", "latlng"]
+
+# Requests in flight at once; the shared scheduler still enforces the quota
+MAX_CONCURRENT_REQUESTS = 8
+
+# --- ASYNC CLIENT ---
+
+class FetchIncomplete(Exception):
+    # Some requests of a batch failed; results keeps the ones that succeeded
+    # so their quota is not wasted, and failed_ids the ones to ask for again
+    def __init__(self, results, failed_ids, error):
+        super().__init__(f"{len(failed_ids)} of the requests failed: {error}")
+        self.results = results
+        self.failed_ids = failed_ids
+        self.error = error
+
+async def fetch_json(url, access_token, semaphore, params=None, priority=strava_api.BACKFILL, cache=True,
+                     max_wait=None):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    async with semaphore:
+        # The pooled session and rate-limit scheduler are blocking, so each
+        # request runs on a worker thread while the event loop fans out
+        response = await asyncio.to_thread(strava_api.get, url, headers=headers, params=params, priority=priority,
+                                           cache=cache, max_wait=max_wait)
+    if response.status_code == 404:
+        # Deleted or private activities are skipped rather than failing the batch
+        return None
+    response.raise_for_status()
+    return response.json()
+
+async def gather_by_id(activity_ids, fetch_one):
+    results = await asyncio.gather(*(fetch_one(activity_id) for activity_id in activity_ids), return_exceptions=True)
+    fetched = {activity_id: result for activity_id, result in zip(activity_ids, results)
+               if result is not None and not isinstance(result, BaseException)}
+    errors = [(activity_id, result) for activity_id, result in zip(activity_ids, results)
+              if isinstance(result, BaseException)]
+    if errors:
+        raise FetchIncomplete(fetched, [activity_id for activity_id, _ in errors], errors[0][1])
+    return fetched
+
+async def fetch_activity_details_async(access_token, activity_ids, max_concurrent=MAX_CONCURRENT_REQUESTS,
+                                       priority=strava_api.BACKFILL):
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def fetch_one(activity_id):
+        url = STRAVA_ACTIVITY_URL.format(activity_id=activity_id)
+        return await fetch_json(url, access_token, semaphore, priority=priority)
+
+    return await gather_by_id(activity_ids, fetch_one)
+
+async def fetch_activity_streams_async(access_token, activity_ids, keys=STREAM_KEYS,
+                                       max_concurrent=MAX_CONCURRENT_REQUESTS, priority=strava_api.BACKFILL,
+                                       cache=True, max_wait=None):
+    semaphore = asyncio.Semaphore(max_concurrent)
+    params = {"keys": ",".join(keys), "key_by_type": "true"}
+
+    async def fetch_one(activity_id):
+        url = STRAVA_STREAMS_URL.format(activity_id=activity_id)
+        streams = await fetch_json(url, access_token, semaphore, params=params, priority=priority, cache=cache,
+                                   max_wait=max_wait)
+        if streams is None:
+            return None
+        # A stream without data is stored like a missing one
+        return {key: stream.get("data") for key, stream in streams.items()}
+
+    return await gather_by_id(activity_ids, fetch_one)
+
+# --- BLOCKING WRAPPERS ---
+
+def fetch_activity_details(access_token, activity_ids, **kwargs):
+    return asyncio.run(fetch_activity_details_async(access_token, list(activity_ids), **kwargs))
+
+def fetch_activity_streams(access_token, activity_ids, **kwargs):
+    return asyncio.run(fetch_activity_streams_async(access_token, list(activity_ids), **kwargs))
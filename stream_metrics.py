@@ -0,0 +1,242 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Metrics computed over the per-second streams from streams_store.load_streams,
+# vectorized over the samples rather than looping over them in Python.
+
+# --- CONFIGURATION ---
+
+# Mean-maximal curves cover every whole second from 1 s up to this duration
+MAX_CURVE_SEC = 3 * 60 * 60
+
+# Window gains computed at once per activity, bounding the working memory
+CURVE_BLOCK_ELEMENTS = 2_000_000
+
+# Race predictions fit the curve over durations of at least this long, so
+# sprints and GPS spikes do not bend the endurance trend
+PREDICTION_MIN_SEC = 5 * 60
+
+# Zone histograms: seconds spent in each 1 bpm heart-rate bin and each 5 s/km
+# pace bin. Zones are applied when the histograms are read, so a new max
+# heart rate or target pace never means re-reading streams.
+HR_BIN_EDGES = np.arange(0, 251)  # bpm
+PACE_BIN_EDGES = np.arange(120, 905, 5)  # sec/km; faster or slower go in the end bins
+
+# Longer gaps between samples are pauses and count towards no zone
+MAX_SAMPLE_GAP_SEC = 10
+
+# Pace is taken over this many samples, smoothing out GPS jitter
+PACE_WINDOW_SAMPLES = 10
+
+# --- HELPERS ---
+
+def activity_index(offsets):
+    # Position of the owning activity for every sample
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def segment_reduce(ufunc, values, offsets, empty):
+    # ufunc.reduceat per activity along the last axis, with empty activities
+    # getting the given value instead of reduceat's neighbouring element
+    sizes = np.diff(offsets)
+    result = np.full(values.shape[:-1] + (len(sizes),), empty, dtype=np.float64)
+    nonempty = np.flatnonzero(sizes)
+    if len(nonempty):
+        result[..., nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty], axis=-1)
+    return result
+
+# --- BEST EFFORTS ---
+
+def best_efforts(streams, distances_m):
+    # Fastest time (s) over each distance within each activity, shaped
+    # (activities, distances); NaN where an activity is shorter than the
+    # distance or has no distance stream. Needs only the time and distance
+    # streams. Working memory is about 70 bytes per sample and distance, so
+    # long histories should be passed in chunks (streams_store.iter_streams).
+    #
+    # A two-pointer scan: for each window end, the start is the last sample
+    # at least the distance behind it. Both pointers only move forward, so
+    # every start is found with one searchsorted over the whole history,
+    # with activities laid end to end and separated by more than the
+    # longest distance so no window spans two of them.
+    offsets = streams["offsets"]
+    n_activities = len(offsets) - 1
+    distances_m = np.asarray(distances_m, dtype=np.float64)
+    if not len(streams["time"]):
+        return np.full((n_activities, len(distances_m)), np.nan)
+
+    owner = activity_index(offsets)
+    distance = np.nan_to_num(streams["distance"], nan=-1.0)
+    lengths = segment_reduce(np.maximum, distance, offsets, -1.0)
+    gap = np.max(distances_m) + 1
+    shift = np.concatenate(([0], np.cumsum(np.maximum(lengths, 0) + gap)[:-1]))
+    # GPS corrections can step backwards; windows need a monotonic distance
+    track = np.maximum.accumulate(distance + shift[owner])
+    time = streams["time"].astype(np.float64)
+
+    # All distances in one batch: row k holds every window end for distance k
+    targets = track[np.newaxis, :] - distances_m[:, np.newaxis]
+    start = np.searchsorted(track, targets.ravel(), side="right").reshape(targets.shape) - 1
+    valid = (start >= 0) & (owner[np.maximum(start, 0)] == owner) & (distance >= 0)
+    start = np.where(valid, start, 0)
+
+    # Interpolate the start between samples so the window is exactly the distance
+    after = np.minimum(start + 1, len(track) - 1)
+    span = track[after] - track[start]
+    fraction = np.divide(targets - track[start], span, out=np.zeros(targets.shape), where=span > 0)
+    start_time = time[start] + fraction * (time[after] - time[start])
+    elapsed = np.where(valid, time[np.newaxis, :] - start_time, np.inf)
+
+    best = segment_reduce(np.minimum, elapsed, offsets, np.inf)
+    return np.where(np.isfinite(best), best, np.nan).T
+
+# --- MEAN-MAXIMAL CURVES ---
+
+def resample_distance(time, distance):
+    # Distance at every whole second, so a window of k samples lasts k seconds
+    return np.interp(np.arange(time[0], time[-1] + 1), time, distance)
+
+def activity_speed_curve(distance, max_duration=MAX_CURVE_SEC):
+    # Best average speed (m/s) for every duration of 1..max_duration seconds
+    # within one activity resampled to 1 Hz; NaN beyond its length. Gains
+    # for a block of durations are one subtraction of a sliding window
+    # view, padded with -inf so windows past the end never win.
+    curve = np.full(max_duration, np.nan)
+    n = len(distance)
+    longest = min(max_duration, n - 1)
+    if longest < 1:
+        return curve
+    block = max(1, CURVE_BLOCK_ELEMENTS // n)
+    padded = np.concatenate((distance, np.full(longest + 1, -np.inf)))
+    for first in range(1, longest + 1, block):
+        durations = np.arange(first, min(first + block, longest + 1))
+        ends = sliding_window_view(padded[first:], n)[:len(durations)]
+        curve[durations - 1] = (ends - distance).max(axis=1) / durations
+    return curve
+
+def speed_curves(streams, max_duration=MAX_CURVE_SEC):
+    # Per-activity mean-maximal speed curves, shaped (activities, durations)
+    offsets = streams["offsets"]
+    curves = np.full((len(offsets) - 1, max_duration), np.nan)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        time = streams["time"][start:end]
+        distance = streams["distance"][start:end]
+        if end - start < 2 or np.isnan(distance).any():
+            continue
+        distance = np.maximum.accumulate(distance)
+        curves[i] = activity_speed_curve(resample_distance(time, distance), max_duration)
+    return curves
+
+def merge_curves(curve, curves):
+    # Element-wise best, ignoring durations a curve does not reach
+    return np.fmax(curve, np.fmax.reduce(curves, axis=0)) if len(curves) else curve
+
+def predict_race_times(curve, distances_m, min_duration=PREDICTION_MIN_SEC):
+    # Fits speed = a * duration^b to the curve (Riegel's power law) and
+    # solves distance = a * duration^(b + 1) for each race distance
+    durations = np.arange(1, len(curve) + 1)
+    valid = np.isfinite(curve) & (curve > 0) & (durations >= min_duration)
+    distances_m = np.asarray(distances_m, dtype=np.float64)
+    if valid.sum() < 2:
+        return np.full(len(distances_m), np.nan)
+    b, log_a = np.polyfit(np.log(durations[valid]), np.log(curve[valid]), 1)
+    return (distances_m / np.exp(log_a)) ** (1 / (b + 1))
+
+# --- ZONES ---
+
+def sample_durations(streams):
+    # Seconds each sample stands for: the gap since the previous sample of the
+    # same activity, or nothing for first samples and pauses
+    time = streams["time"]
+    durations = np.diff(time, prepend=time[:1]).astype(np.float64)
+    durations[streams["offsets"][:-1][np.diff(streams["offsets"]) > 0]] = 0
+    durations[durations > MAX_SAMPLE_GAP_SEC] = 0
+    return durations
+
+def binned_time(owner, bins, weights, n_activities, n_bins):
+    # One weighted bincount over every sample of every activity
+    counts = np.bincount(owner * n_bins + bins, weights=weights, minlength=n_activities * n_bins)
+    return counts.reshape(n_activities, n_bins)
+
+def zone_histograms(streams):
+    # Per-activity time (s) in each heart-rate bin and each pace bin, shaped
+    # (activities, bins); activities without a stream get all zeros
+    offsets = streams["offsets"]
+    n_activities = len(offsets) - 1
+    owner = activity_index(offsets)
+    durations = sample_durations(streams)
+
+    heartrate = streams["heartrate"]
+    has_hr = np.isfinite(heartrate)
+    n_hr_bins = len(HR_BIN_EDGES) - 1
+    hr_bins = np.clip(np.searchsorted(HR_BIN_EDGES, np.where(has_hr, heartrate, 0), side="right") - 1,
+                      0, n_hr_bins - 1)
+    hr = binned_time(owner, hr_bins, np.where(has_hr, durations, 0), n_activities, n_hr_bins)
+
+    # Pace over the last PACE_WINDOW_SAMPLES samples of the same activity
+    distance = streams["distance"]
+    lag = np.arange(len(distance)) - PACE_WINDOW_SAMPLES
+    has_pace = (lag >= offsets[:-1][owner]) & np.isfinite(distance)
+    lag = np.maximum(lag, 0)
+    covered_km = np.where(has_pace, distance - distance[lag], 0) / 1000
+    elapsed = (streams["time"] - streams["time"][lag]).astype(np.float64)
+    pace = np.divide(elapsed, covered_km, out=np.full(len(distance), np.inf), where=covered_km > 0)
+    n_pace_bins = len(PACE_BIN_EDGES) - 1
+    pace_bins = np.clip(np.searchsorted(PACE_BIN_EDGES, pace, side="right") - 1, 0, n_pace_bins - 1)
+    pace_hist = binned_time(owner, pace_bins, np.where(has_pace, durations, 0), n_activities, n_pace_bins)
+    return hr, pace_hist
+
+def zone_times(histograms, bin_edges, zone_upper_edges):
+    # Sums histogram bins (by their centre) into zones given by ascending
+    # upper edges; the last zone takes everything above
+    centres = (bin_edges[:-1] + bin_edges[1:]) / 2
+    zones = np.minimum(np.searchsorted(zone_upper_edges, centres, side="right"), len(zone_upper_edges) - 1)
+    membership = np.zeros((len(centres), len(zone_upper_edges)))
+    membership[np.arange(len(centres)), zones] = 1
+    return histograms @ membership
+
+def estimate_max_heartrate(hr_histogram, min_seconds=30):
+    # Highest heart rate held for at least min_seconds in total, which skips
+    # single-sample strap spikes
+    held = np.flatnonzero(hr_histogram >= min_seconds)
+    return float(HR_BIN_EDGES[held[-1] + 1]) if len(held) else None
+
+# --- SPLITS ---
+
+def interpolate_at(values, lower, fraction):
+    return values[lower] + fraction * (values[lower + 1] - values[lower])
+
+def splits(streams, split_m):
+    # Splits of one activity: every full split_m plus the remainder. One
+    # searchsorted finds the samples around every boundary, and time,
+    # altitude and accumulated heartbeats are interpolated between them.
+    time = streams["time"].astype(np.float64)
+    distance = np.maximum.accumulate(streams["distance"])
+    boundaries = np.arange(split_m, distance[-1], split_m)
+    # A remainder of under a metre is GPS noise, not a split
+    if not len(boundaries) or distance[-1] - boundaries[-1] >= 1:
+        boundaries = np.append(boundaries, distance[-1])
+
+    lower = np.clip(np.searchsorted(distance, boundaries, side="left") - 1, 0, len(distance) - 2)
+    span = distance[lower + 1] - distance[lower]
+    fraction = np.clip(np.divide(boundaries - distance[lower], span, out=np.ones(len(boundaries)), where=span > 0),
+                       0, 1)
+
+    crossing = interpolate_at(time, lower, fraction)
+    elapsed = np.diff(crossing, prepend=time[0])
+
+    # Heartbeats so far (bpm * s / 60), so a split's average is beats over its duration
+    heartrate = streams["heartrate"].astype(np.float64)
+    beats = np.concatenate(([0], np.cumsum((heartrate[1:] + heartrate[:-1]) / 2 * np.diff(time))))
+    beats_at = interpolate_at(beats, lower, fraction)
+    average_hr = np.divide(np.diff(beats_at, prepend=0), elapsed, out=np.full(len(elapsed), np.nan),
+                           where=elapsed > 0)
+
+    altitude = streams["altitude"].astype(np.float64)
+    altitude_at = interpolate_at(altitude, lower, fraction)
+
+    return {
+        "distance_m": np.diff(boundaries, prepend=0),
+        "elapsed_sec": elapsed,
+        "average_hr": average_hr,
+        "elevation_m": np.diff(altitude_at, prepend=altitude[0])
+    }
@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import requests
+
+import activity_db
+import arrow_parts
+import strava_api
+import strava_async
+import stream_metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+
+# Directory holding the Arrow part files of per-second streams per athlete
+STREAMS_DIR = "streams"
+
+# Bump when the stored columns or their encoding change
+STREAMS_VERSION = 1
+
+# Fixed-point scales for the delta-encoded integer columns
+DISTANCE_SCALE = 100  # centimetres
+LATLNG_SCALE = 10 ** 7  # 1e-7 degrees, about 1 cm
+
+# Stored columns, one row per sample and one record batch per activity.
+# Monotonic or smooth streams are stored as deltas from the previous sample,
+# the rest as plain values; a stream the activity lacks is all nulls.
+COLUMNS = [
+    ("time", "int32"),  # delta, seconds
+    ("distance", "int32"),  # delta, centimetres
+    ("lat", "int32"),  # delta, 1e-7 degrees
+    ("lng", "int32"),  # delta, 1e-7 degrees
+    ("heartrate", "int16"),  # bpm
+    ("cadence", "int16"),  # steps per minute, one foot
+    ("altitude", "float32")  # metres
+]
+
+DELTA_COLUMNS = {"time": 1, "distance": DISTANCE_SCALE, "lat": LATLNG_SCALE, "lng": LATLNG_SCALE}
+
+# Samples decoded at once by iter_streams; whole-history metrics work chunk
+# by chunk so their memory does not grow with the history
+CHUNK_SAMPLES = 250_000
+
+# Activities whose streams are fetched and written together
+BACKFILL_BATCH_SIZE = 50
+
+# Backfill requests give up after waiting this long for quota and the worker
+# retries when the window resets, so no thread ever blocks for a whole
+# window (which would also hold up interpreter shutdown)
+BACKFILL_MAX_WAIT_SEC = 10
+
+# --- HELPERS ---
+
+def stream_schema():
+    # Built on use, so only reading or writing streams loads pyarrow
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in COLUMNS])
+
+def athlete_dir(athlete_id):
+    return os.path.join(STREAMS_DIR, f"v{STREAMS_VERSION}", str(athlete_id))
+
+def part_schema(ids):
+    # Each part lists the activities of its batches, in order, in its metadata
+    return stream_schema().with_metadata({"activity_ids": json.dumps(ids)})
+
+def batch_ids(reader):
+    return json.loads(reader.schema.metadata[b"activity_ids"])
+
+def locate_batches(parts):
+    # Where each stored activity's batch lives, as {activity_id: (reader,
+    # position)} in the order activities were first stored; later parts win
+    # when an activity was stored again
+    batches = {}
+    for path in parts:
+        reader = arrow_parts.open_part(path)
+        for i, activity_id in enumerate(batch_ids(reader)):
+            batches[activity_id] = (reader, i)
+    return batches
+
+def open_batches(athlete_id):
+    return arrow_parts.read_parts(athlete_dir(athlete_id), locate_batches)
+
+def merge_batches(parts):
+    # The current batch of every activity, to compact the parts into one
+    stored = locate_batches(parts)
+    return part_schema(list(stored)), [reader.get_batch(i) for reader, i in stored.values()]
+
+def delta_encode(values, scale):
+    values = np.asarray(values, dtype=np.float64)
+    if not np.isfinite(values).all():
+        # A missing sample would turn into garbage in every later delta
+        raise ValueError("stream has missing samples")
+    scaled = np.rint(values * scale).astype(np.int64)
+    return np.diff(scaled, prepend=0).astype(np.int32)
+
+def encode_streams(streams):
+    # streams is Strava's {key: data} for one activity; an activity without
+    # a time stream (manual entries, deleted activities) stores no samples
+    import pyarrow as pa
+
+    schema = stream_schema()
+    n = len(streams.get("time") or [])
+    values = {}
+    if n:
+        values["time"] = delta_encode(streams["time"], 1)
+        if len(streams.get("distance") or []) == n:
+            values["distance"] = delta_encode(streams["distance"], DISTANCE_SCALE)
+        if len(streams.get("latlng") or []) == n:
+            latlng = np.asarray(streams["latlng"], dtype=np.float64).reshape(n, 2)
+            values["lat"] = delta_encode(latlng[:, 0], LATLNG_SCALE)
+            values["lng"] = delta_encode(latlng[:, 1], LATLNG_SCALE)
+        for key in ("heartrate", "cadence", "altitude"):
+            if len(streams.get(key) or []) == n:
+                values[key] = np.asarray(streams[key], dtype=schema.field(key).type.to_pandas_dtype())
+    columns = [pa.array(values[field.name], type=field.type) if field.name in values else pa.nulls(n, field.type)
+               for field in schema]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def encode_or_empty(activity_id, streams):
+    # Malformed streams (e.g. a None sample) are stored empty, like an activity
+    # without streams, so one bad activity neither fails the rest of its batch
+    # nor is fetched again on every backfill
+    try:
+        return encode_streams(streams)
+    except (TypeError, ValueError, KeyError):
+        logger.warning("Storing activity %s without streams, its streams are malformed", activity_id, exc_info=True)
+        return encode_streams({})
+
+def segment_cumsum(deltas, offsets):
+    # Undo the delta encoding of many activities at once: one running sum over
+    # everything, minus the total carried in from the activities before
+    totals = np.cumsum(deltas, dtype=np.int64)
+    if not len(totals):
+        return totals
+    starts = offsets[:-1]
+    carried = np.where(starts > 0, totals[np.maximum(starts - 1, 0)], 0)
+    return totals - np.repeat(carried, np.diff(offsets))
+
+def decode_table(table, offsets, columns=None):
+    streams = {}
+    for name, _ in COLUMNS:
+        if columns is not None and name not in columns:
+            continue
+        column = table.column(name).combine_chunks()
+        valid = np.asarray(column.is_valid()) if column.null_count else None
+        if name in DELTA_COLUMNS:
+            deltas = column.fill_null(0).to_numpy() if valid is not None else column.to_numpy()
+            decoded = segment_cumsum(deltas, offsets)
+            if name == "time":
+                streams["time"] = decoded
+                continue
+            decoded = decoded / DELTA_COLUMNS[name]
+        else:
+            decoded = column.to_numpy(zero_copy_only=False).astype(np.float32)
+        if valid is not None:
+            decoded[~valid] = np.nan
+        streams[name] = decoded
+    return streams
+
+# --- STORE ---
+
+def stored_activity_ids(athlete_id):
+    return list(open_batches(athlete_id))
+
+def get_streams_version(athlete_id):
+    # Changes whenever new streams are written for the athlete; part names
+    # are unique, so the newest one identifies the stored set
+    parts = arrow_parts.list_parts(athlete_dir(athlete_id))
+    return f"{len(parts)}:{os.path.basename(parts[-1])}" if parts else None
+
+def decode_batches(ids, batches, columns=None):
+    import pyarrow as pa
+
+    offsets = np.concatenate(([0], np.cumsum([batch.num_rows for batch in batches], dtype=np.int64)))
+    streams = decode_table(pa.Table.from_batches(batches, schema=stream_schema()), offsets, columns)
+    streams["activity_id"] = np.array(ids, dtype=np.int64)
+    streams["offsets"] = offsets
+    return streams
+
+def load_streams(athlete_id, activity_ids=None, columns=None):
+    # Returns the decoded samples of every stored activity (or just the given
+    # ones), concatenated: activity_id and offsets delimit each activity's
+    # samples in time (s), distance (m), lat / lng (degrees), heartrate,
+    # cadence and altitude, or only the given columns; samples a stream
+    # lacks are NaN
+    stored = open_batches(athlete_id)
+    if not stored:
+        return None
+    wanted = set(activity_ids) if activity_ids is not None else None
+    ids = [activity_id for activity_id in stored if wanted is None or activity_id in wanted]
+    return decode_batches(ids, [reader.get_batch(i) for reader, i in (stored[activity_id] for activity_id in ids)],
+                          columns)
+
+def iter_streams(athlete_id, columns=None, max_samples=CHUNK_SAMPLES):
+    # Like load_streams over every stored activity, but decoded a chunk of
+    # whole activities (about max_samples samples) at a time
+    ids, batches, samples = [], [], 0
+    for activity_id, (reader, i) in open_batches(athlete_id).items():
+        batch = reader.get_batch(i)
+        if batches and samples + batch.num_rows > max_samples:
+            yield decode_batches(ids, batches, columns)
+            ids, batches, samples = [], [], 0
+        ids.append(activity_id)
+        batches.append(batch)
+        samples += batch.num_rows
+    if batches:
+        yield decode_batches(ids, batches, columns)
+
+def append_streams(athlete_id, streams_by_id):
+    # Only the new activities are written, as one more part file; re-fetched
+    # activities shadow their older batch until the next compaction
+    if not streams_by_id:
+        return
+    arrow_parts.append_part(athlete_dir(athlete_id), part_schema(list(streams_by_id)),
+                            [encode_or_empty(activity_id, streams) for activity_id, streams in streams_by_id.items()],
+                            merge_batches)
+
+def compact_streams(athlete_id):
+    arrow_parts.compact_parts(athlete_dir(athlete_id), merge_batches)
+
+# --- DERIVED METRICS ---
+
+def update_speed_curve(conn, athlete_id):
+    # Merges only the activities streamed since the last update into the
+    # stored curve, so years of history are never rescanned
+    stored, merged_ids = activity_db.get_speed_curve(conn, athlete_id)
+    if stored is not None:
+        curve = np.frombuffer(stored, dtype=np.float64)
+    else:
+        curve = np.full(stream_metrics.MAX_CURVE_SEC, np.nan)
+    new_ids = [activity_id for activity_id in stored_activity_ids(athlete_id) if activity_id not in merged_ids]
+    if new_ids:
+        curves = stream_metrics.speed_curves(load_streams(athlete_id, new_ids))
+        curve = stream_metrics.merge_curves(curve, curves)
+        activity_db.save_speed_curve(conn, athlete_id, curve.tobytes(), merged_ids.union(new_ids))
+    return curve
+
+def update_zone_histograms(conn, athlete_id):
+    # Histograms are computed once per activity and only read afterwards
+    done = activity_db.get_histogram_activity_ids(conn, athlete_id)
+    new_ids = [activity_id for activity_id in stored_activity_ids(athlete_id) if activity_id not in done]
+    if not new_ids:
+        return
+    streams = load_streams(athlete_id, new_ids)
+    hr, pace = stream_metrics.zone_histograms(streams)
+    activity_db.save_zone_histograms(conn, athlete_id, [
+        (int(activity_id), hr[i].astype(np.float32).tobytes(), pace[i].astype(np.float32).tobytes())
+        for i, activity_id in enumerate(streams["activity_id"])
+    ])
+
+def update_derived_metrics(conn, athlete_id):
+    update_speed_curve(conn, athlete_id)
+    update_zone_histograms(conn, athlete_id)
+
+# --- BACKFILL ---
+
+class StreamBackfill:
+    # Streams cost one request per activity, so a long history takes hours of
+    # Strava quota. A single background thread per process fetches the
+    # missing ones newest first at backfill priority, so pages never wait.
+
+    def __init__(self, batch_size=BACKFILL_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.wakeup = threading.Event()
+        self.worker = None
+
+    def request(self, athlete_id, access_token):
+        with self.lock:
+            self.pending[athlete_id] = access_token
+            # A worker that died on an unexpected error is replaced
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run_worker, name="stream-backfill", daemon=True)
+                self.worker.start()
+        self.wakeup.set()
+
+    def backfill(self, athlete_id, access_token):
+        conn = activity_db.connect()
+        try:
+            run_ids = activity_db.run_activity_ids(conn, athlete_id)
+        finally:
+            conn.close()
+        stored = set(stored_activity_ids(athlete_id))
+        missing = [activity_id for activity_id in run_ids if activity_id not in stored]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            try:
+                streams = strava_async.fetch_activity_streams(access_token, batch, cache=False,
+                                                              max_wait=BACKFILL_MAX_WAIT_SEC)
+                error = None
+            except strava_async.FetchIncomplete as incomplete:
+                # Keep what was fetched before the quota ran out or a request failed
+                streams, error = incomplete.results, incomplete.error
+                batch = [activity_id for activity_id in batch if activity_id not in incomplete.failed_ids]
+            # Activities without streams are stored empty so they are not asked for again
+            append_streams(athlete_id, {activity_id: streams.get(activity_id, {}) for activity_id in batch})
+            # Fold the new activities into the athlete's curve and zones while we're here
+            conn = activity_db.connect()
+            try:
+                update_derived_metrics(conn, athlete_id)
+            finally:
+                conn.close()
+            if error is not None:
+                raise error
+
+    def run_worker(self):
+        retry_at = None
+        while True:
+            self.wakeup.wait(None if retry_at is None else max(0, retry_at - time.time()))
+            self.wakeup.clear()
+            retry_at = None
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for athlete_id, access_token in pending.items():
+                try:
+                    self.backfill(athlete_id, access_token)
+                except strava_api.RateLimitExceeded as error:
+                    # Out of backfill quota: carry on once the window resets
+                    with self.lock:
+                        self.pending.setdefault(athlete_id, access_token)
+                    resume_at = time.time() + error.retry_after
+                    retry_at = resume_at if retry_at is None else min(retry_at, resume_at)
+                except (requests.RequestException, OSError, sqlite3.Error):
+                    # Whatever is still missing is picked up after the next sync
+                    pass
+                except Exception:
+                    # Anything else is a bug, but must not end backfills for
+                    # every athlete for the life of the process
+                    logger.exception("Stream backfill failed for athlete %s", athlete_id)
+
+# Shared by every Streamlit session in this process
+backfill = StreamBackfill()
+
+def request_backfill(athlete_id, access_token):
+    backfill.request(athlete_id, access_token)
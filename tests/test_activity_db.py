@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import activity_db
+
+ATHLETE_ID = 42
+
+def make_activity(activity_id, start, distance=10000, moving_time=3000, type="Run"):
+    return {
+        "id": activity_id,
+        "athlete": {"id": ATHLETE_ID},
+        "type": type,
+        "name": f"Activity {activity_id}",
+        "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "distance": distance,
+        "moving_time": moving_time
+    }
+
+def make_history(n, first=datetime(2024, 1, 1, 7)):
+    # Deterministic runs every other day with a ride every fifth activity
+    return [make_activity(i, first + timedelta(days=2 * i), distance=5000 + 37 * i, moving_time=1500 + 11 * i,
+                          type="Ride" if i % 5 == 4 else "Run")
+            for i in range(n)]
+
+def all_rollups(conn, period):
+    return activity_db.get_rollups(conn, ATHLETE_ID, period, "0000-00-00", "9999-99-99")
+
+def rebuilt_rollups(conn, period):
+    activity_db.rebuild_rollups(conn, ATHLETE_ID)
+    return all_rollups(conn, period)
+
+def test_incremental_rollups_match_full_rebuild(tmp_path):
+    conn = activity_db.connect(str(tmp_path / "activities.db"))
+    history = make_history(120)
+    # Synced in batches, as incremental syncs store them
+    for i in range(0, len(history), 25):
+        activity_db.upsert_activities(conn, history[i:i + 25])
+
+    # An edited activity, one moved to another week and month, and one that
+    # changed from a run to a ride
+    edited = dict(history[10], distance=21097, moving_time=6300)
+    moved = dict(history[20], start_date_local="2024-06-30T09:00:00Z", start_date="2024-06-30T09:00:00Z")
+    retyped = dict(history[30], type="Ride")
+    activity_db.upsert_activities(conn, [edited, moved, retyped])
+
+    for period in activity_db.ROLLUP_PERIODS:
+        incremental = all_rollups(conn, period)
+        assert incremental == rebuilt_rollups(conn, period)
+
+def test_rollups_backfill_databases_from_before_rollups(tmp_path):
+    conn = activity_db.connect(str(tmp_path / "activities.db"))
+    activity_db.upsert_activities(conn, make_history(80))
+    # A database from before rollups: activities but no rollups at all
+    with conn:
+        conn.execute("DELETE FROM run_rollups")
+        conn.execute("DELETE FROM rollup_state")
+
+    # The first sync writes the buckets of its new activity before any read
+    activity_db.upsert_activities(conn, [make_activity(1000, datetime(2024, 7, 1, 7))])
+
+    weeks = all_rollups(conn, "week")
+    assert len(weeks) > 1
+    assert weeks == rebuilt_rollups(conn, "week")
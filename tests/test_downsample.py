@@ -0,0 +1,55 @@
+import numpy as np
+
+import downsample
+
+def noisy_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x / 50) + rng.normal(0, 0.1, n)
+    return x, y
+
+def test_lttb_keeps_short_series_whole():
+    x, y = noisy_series(10)
+    y[3] = np.nan
+    assert np.array_equal(downsample.lttb_indices(x, y, budget=10), np.arange(10))
+
+def test_lttb_stays_within_budget_and_keeps_endpoints():
+    x, y = noisy_series(5000)
+    keep = downsample.lttb_indices(x, y, budget=100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == len(y) - 1
+    assert np.all(np.diff(keep) > 0)
+
+def test_lttb_keeps_a_spike():
+    x, y = noisy_series(5000)
+    y[2345] = 50
+    assert 2345 in downsample.lttb_indices(x, y, budget=100)
+
+def test_lttb_skips_gaps_and_reads_dates():
+    dates = np.datetime64("2024-01-01") + np.arange(3000).astype("timedelta64[D]")
+    _, y = noisy_series(3000)
+    y[[0, 100, 2999]] = np.nan
+    keep = downsample.lttb_indices(dates, y, budget=50)
+    assert len(keep) == 50
+    assert np.isfinite(y[keep]).all()
+    assert keep[0] == 1 and keep[-1] == 2998
+
+def test_min_max_stays_within_budget_and_keeps_extremes():
+    _, y = noisy_series(5000)
+    y[0], y[-1] = 10, -10
+    keep = downsample.min_max_indices(y, budget=100)
+    assert len(keep) <= 100
+    assert keep[0] == 0 and keep[-1] == len(y) - 1
+    assert np.all(np.diff(keep) > 0)
+    # Every bucket's lowest and highest point survives
+    edges = np.linspace(0, len(y), 51).astype(np.int64)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        assert lo + np.argmin(y[lo:hi]) in keep
+        assert lo + np.argmax(y[lo:hi]) in keep
+
+def test_min_max_skips_gaps():
+    _, y = noisy_series(5000)
+    y[::7] = np.nan
+    keep = downsample.min_max_indices(y, budget=100)
+    assert len(keep) <= 100
+    assert np.isfinite(y[keep]).all()
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+# The dashboard is a Streamlit script, so it cannot be imported on its own;
+# these are the modules it imports at the top
+APP_MODULES = ["streamlit", "activity_db", "aggregation", "arrow_parts", "downsample", "goal_store", "http_cache",
+               "runs_cache", "stream_metrics", "strava_api", "strava_async", "streams_store"]
+
+# Libraries only the stages that need them import
+DEFERRED_MODULES = ["pandas", "matplotlib", "pyarrow"]
+
+# Module-level import time of APP_MODULES. About 0.6 s here, and about
+# 1.25 s once the deferred libraries are imported too.
+IMPORT_BUDGET_SEC = 1.0
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_app_modules():
+    # A fresh interpreter, so nothing is already imported; returns the
+    # -X importtime report and the deferred modules that got loaded
+    code = (f"import sys\nimport {', '.join(APP_MODULES)}\n"
+            f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    return result.stderr, [m for m in result.stdout.strip().split(",") if m]
+
+def total_import_sec(report):
+    # Sum of the cumulative times of the top-level imports, the lines with
+    # no nesting in "import time: self [us] | cumulative | imported package"
+    total = 0
+    for line in report.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2][1:].startswith(" "):
+            total += int(fields[1])
+    return total / 1e6
+
+def test_app_modules_do_not_import_deferred_libraries():
+    _, loaded = import_app_modules()
+    assert loaded == []
+
+def test_app_modules_import_within_budget():
+    # Best of three, so one slow start on a busy machine does not fail it
+    best = min(total_import_sec(import_app_modules()[0]) for _ in range(3))
+    assert best < IMPORT_BUDGET_SEC, f"importing the app took {best:.2f} s"
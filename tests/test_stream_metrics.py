@@ -0,0 +1,148 @@
+import numpy as np
+
+import stream_metrics
+import streams_store
+
+def concat_streams(activities):
+    # Activities as load_streams returns them: samples laid end to end,
+    # delimited by offsets
+    sizes = [len(activity["time"]) for activity in activities]
+    streams = {"offsets": np.concatenate(([0], np.cumsum(sizes))).astype(np.int64),
+               "activity_id": np.arange(len(activities), dtype=np.int64)}
+    for key in ("time", "distance", "heartrate", "altitude"):
+        streams[key] = np.concatenate([np.asarray(activity[key], dtype=np.float64) for activity in activities])
+    streams["time"] = streams["time"].astype(np.int64)
+    return streams
+
+def random_run(n, seed):
+    rng = np.random.default_rng(seed)
+    time = np.cumsum(rng.integers(1, 4, n)) - 1
+    # Mostly forward, with the odd GPS correction stepping back
+    distance = np.cumsum(rng.uniform(-0.5, 8, n) * np.diff(time, prepend=0))
+    return {"time": time, "distance": distance, "heartrate": rng.integers(120, 180, n),
+            "altitude": 100 + np.cumsum(rng.normal(0, 0.3, n))}
+
+def empty_run():
+    return {"time": [], "distance": [], "heartrate": [], "altitude": []}
+
+# --- BEST EFFORTS ---
+
+def brute_force_best_effort(time, distance, distance_m):
+    # Every window end against the last sample at least distance_m behind it
+    track = np.maximum.accumulate(distance)
+    best = np.inf
+    for end in range(len(track)):
+        target = track[end] - distance_m
+        starts = np.flatnonzero(track[:end + 1] <= target)
+        if not len(starts):
+            continue
+        start = starts[-1]
+        start_time = time[start]
+        if start + 1 < len(track) and track[start + 1] > track[start]:
+            fraction = (target - track[start]) / (track[start + 1] - track[start])
+            start_time += fraction * (time[start + 1] - time[start])
+        best = min(best, time[end] - start_time)
+    return best if np.isfinite(best) else np.nan
+
+def test_best_efforts_match_brute_force():
+    no_distance = dict(random_run(300, seed=9), distance=np.full(300, np.nan))
+    activities = [random_run(800, seed=1), empty_run(), random_run(400, seed=2), no_distance, random_run(60, seed=3)]
+    distances_m = [100, 400, 1000, 2000]
+    best = stream_metrics.best_efforts(concat_streams(activities), distances_m)
+
+    assert best.shape == (len(activities), len(distances_m))
+    for i, activity in enumerate(activities):
+        for k, distance_m in enumerate(distances_m):
+            if not len(activity["time"]) or np.isnan(activity["distance"]).all():
+                expected = np.nan
+            else:
+                expected = brute_force_best_effort(activity["time"].astype(np.float64), activity["distance"],
+                                                   distance_m)
+            np.testing.assert_allclose(best[i, k], expected, rtol=1e-9, atol=1e-6)
+    assert np.isfinite(best[0]).all() and np.isfinite(best[2]).all()
+    # Too short for the longer distances, and nothing for the empty and
+    # distance-less activities
+    assert np.isnan(best[4, 3])
+    assert np.isnan(best[1]).all() and np.isnan(best[3]).all()
+
+def test_best_efforts_of_no_samples():
+    best = stream_metrics.best_efforts(concat_streams([empty_run(), empty_run()]), [400, 1000])
+    assert best.shape == (2, 2) and np.isnan(best).all()
+
+# --- SPEED CURVES ---
+
+def test_speed_curve_matches_brute_force():
+    rng = np.random.default_rng(4)
+    time = np.arange(120)
+    distance = np.cumsum(rng.uniform(2, 5, 120))
+    activity = {"time": time, "distance": distance, "heartrate": np.zeros(120), "altitude": np.zeros(120)}
+    curve = stream_metrics.speed_curves(concat_streams([activity]), max_duration=150)[0]
+
+    for duration in range(1, 120):
+        expected = np.max(distance[duration:] - distance[:-duration]) / duration
+        np.testing.assert_allclose(curve[duration - 1], expected)
+    assert np.isnan(curve[119:]).all()
+
+# --- SPLITS ---
+
+def steady_run(total_m, speed=2.5, heartrate=150):
+    # One sample a second at a steady speed, climbing a metre every 100 m
+    time = np.arange(0, int(np.ceil(total_m / speed)) + 1)
+    distance = np.minimum(time * speed, total_m)
+    return {"time": time, "distance": distance, "heartrate": np.full(len(time), heartrate),
+            "altitude": distance / 100}
+
+def test_splits_boundaries_and_remainder():
+    result = stream_metrics.splits(steady_run(2600), 1000)
+    np.testing.assert_allclose(result["distance_m"], [1000, 1000, 600])
+    np.testing.assert_allclose(result["elapsed_sec"], [400, 400, 240])
+    np.testing.assert_allclose(result["average_hr"], [150, 150, 150])
+    np.testing.assert_allclose(result["elevation_m"], [10, 10, 6])
+
+def test_splits_ignore_a_remainder_under_a_metre():
+    result = stream_metrics.splits(steady_run(2000.5), 1000)
+    np.testing.assert_allclose(result["distance_m"], [1000, 1000])
+
+def test_splits_of_a_run_shorter_than_one_split():
+    result = stream_metrics.splits(steady_run(700), 1609.344)
+    np.testing.assert_allclose(result["distance_m"], [700])
+    np.testing.assert_allclose(result["elapsed_sec"], [280])
+
+# --- STREAM ENCODING ---
+
+def test_delta_encoding_round_trips():
+    rng = np.random.default_rng(5)
+    n = 500
+    time = np.cumsum(rng.integers(1, 3, n)) - 1
+    full = {
+        "time": time.tolist(),
+        "distance": np.round(np.cumsum(rng.uniform(0, 5, n)), 1).tolist(),
+        "latlng": np.column_stack([45 + np.cumsum(rng.normal(0, 1e-5, n)),
+                                   7 + np.cumsum(rng.normal(0, 1e-5, n))]).round(6).tolist(),
+        "heartrate": rng.integers(100, 190, n).tolist(),
+        "altitude": np.round(100 + np.cumsum(rng.normal(0, 0.2, n)), 1).tolist()
+    }
+    # No cadence, and a second activity with only time and distance
+    partial = {"time": list(range(30)), "distance": [2.5 * t for t in range(30)]}
+    batches = [streams_store.encode_streams(full), streams_store.encode_streams({}),
+               streams_store.encode_streams(partial)]
+    streams = streams_store.decode_batches([1, 2, 3], batches)
+
+    np.testing.assert_array_equal(streams["offsets"], [0, n, n, n + 30])
+    np.testing.assert_array_equal(streams["time"][:n], full["time"])
+    np.testing.assert_allclose(streams["distance"][:n], full["distance"], atol=0.005)
+    latlng = np.array(full["latlng"])
+    np.testing.assert_allclose(streams["lat"][:n], latlng[:, 0], atol=1e-7)
+    np.testing.assert_allclose(streams["lng"][:n], latlng[:, 1], atol=1e-7)
+    np.testing.assert_array_equal(streams["heartrate"][:n], full["heartrate"])
+    np.testing.assert_allclose(streams["altitude"][:n], full["altitude"], atol=1e-4)
+    assert np.isnan(streams["cadence"]).all()
+
+    # The second activity's deltas start from zero again
+    np.testing.assert_array_equal(streams["time"][n:], partial["time"])
+    np.testing.assert_allclose(streams["distance"][n:], partial["distance"])
+    assert np.isnan(streams["heartrate"][n:]).all()
+
+def test_malformed_streams_are_stored_empty():
+    batch = streams_store.encode_or_empty(1, {"time": [0, 1, None], "heartrate": [120, None, 130]})
+    assert batch.num_rows == 0